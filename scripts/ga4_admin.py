@@ -0,0 +1,537 @@
+"""
+GA4 Admin Module - shared Admin API client, setup automation and call policy
+
+Used by setup-ga4-secure.py and the fleet tooling (ga4_fleet.py). Every
+Admin API call made through GA4SetupAutomation.call() shares one rate
+limiter and retries quota and transient errors with exponential backoff.
+
+CredentialPool routes properties owned by different Google accounts or
+service accounts to the right client, so one process can work across
+tenants.
+"""
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from ga4_config import authenticate_oauth, get_token_path
+from ga4_trace import record_span, span
+
+# Configuration
+SCOPES = ['https://www.googleapis.com/auth/analytics.edit']
+
+# Access bindings additionally need the user-management scope
+USER_MANAGEMENT_SCOPES = SCOPES + ['https://www.googleapis.com/auth/analytics.manage.users']
+
+# Custom dimensions to create
+CUSTOM_DIMENSIONS = [
+    {
+        'parameter_name': 'source',
+        'display_name': 'Event Source',
+        'description': 'Where the event originated from',
+        'scope': 'EVENT'
+    },
+    {
+        'parameter_name': 'destination',
+        'display_name': 'Destination',
+        'description': 'Where the user is being directed',
+        'scope': 'EVENT'
+    },
+    {
+        'parameter_name': 'budget',
+        'display_name': 'Budget Level',
+        'description': 'User budget tier from qualification forms',
+        'scope': 'EVENT'
+    },
+    {
+        'parameter_name': 'scene',
+        'display_name': 'Adventure Scene',
+        'description': 'Current scene in adventure game',
+        'scope': 'EVENT'
+    },
+    {
+        'parameter_name': 'choice',
+        'display_name': 'Adventure Choice',
+        'description': 'Choice made in adventure game',
+        'scope': 'EVENT'
+    },
+    {
+        'parameter_name': 'player_name',
+        'display_name': 'Player Name',
+        'description': 'Name used in adventure game',
+        'scope': 'USER'
+    }
+]
+
+# Events to mark as conversions
+CONVERSION_EVENTS = [
+    'conversion_savvycal_booking_click',
+    'form_submit',
+]
+
+# Admin API calls per second across all workers in this process
+DEFAULT_QPS = 10.0
+
+# Attempts for calls that fail with quota or transient errors
+MAX_ATTEMPTS = 6
+
+# Items requested per page when listing resources (the Admin API maximum is 200)
+LIST_PAGE_SIZE = 200
+
+
+class RateLimiter:
+    """Thread-safe token bucket shared by every worker in a fleet run"""
+
+    def __init__(self, qps: float = DEFAULT_QPS, burst: Optional[int] = None):
+        self.qps = qps
+        self.capacity = burst or max(1, int(qps))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until one is free; returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.qps)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.qps
+            time.sleep(wait)
+            waited += wait
+
+
+def _is_retryable(error: Exception) -> bool:
+    from google.api_core import exceptions
+
+    return isinstance(error, (
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+        exceptions.DeadlineExceeded,
+        exceptions.InternalServerError,
+    ))
+
+
+class Record:
+    """
+    Compact stand-in for a listed Admin API resource.
+
+    Listing results are converted page by page into these, so only the
+    fields the planner and exporter use outlive the response protos.
+    """
+    __slots__ = ()
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+class CustomDimensionRecord(Record):
+    __slots__ = ('parameter_name', 'display_name', 'description', 'scope', 'disallow_ads_personalization')
+
+    def __init__(self, dim):
+        self.parameter_name = dim.parameter_name
+        self.display_name = dim.display_name
+        self.description = dim.description
+        self.scope = dim.scope.name
+        self.disallow_ads_personalization = dim.disallow_ads_personalization
+
+
+class WebStreamRecord(Record):
+    __slots__ = ('name', 'display_name', 'default_uri', 'measurement_id')
+
+    def __init__(self, stream):
+        self.name = stream.name
+        self.display_name = stream.display_name
+        self.default_uri = stream.web_stream_data.default_uri
+        self.measurement_id = stream.web_stream_data.measurement_id
+
+
+class AudienceRecord(Record):
+    __slots__ = ('name', 'display_name')
+
+    def __init__(self, audience):
+        self.name = audience.name
+        self.display_name = audience.display_name
+
+
+class AccessBindingRecord(Record):
+    __slots__ = ('name', 'user', 'roles')
+
+    def __init__(self, binding):
+        self.name = binding.name
+        self.user = binding.user.lower()
+        self.roles = sorted(binding.roles)
+
+
+class GA4SetupAutomation:
+    def __init__(self, property_id: str, credentials=None, client=None,
+                 limiter: Optional[RateLimiter] = None):
+        self.property_id = property_id
+        self.property_path = f"properties/{property_id}"
+        self.limiter = limiter or RateLimiter()
+        
+        # Fleet runs share one client (and its channel) across properties
+        self.client = client or build_admin_client(credentials)
+    
+    def call(self, method: str, **kwargs):
+        """Rate-limited Admin API call, retried on quota and transient errors"""
+        with span(f"admin.{method}", method=method) as call_span:
+            for attempt in range(MAX_ATTEMPTS):
+                started = time.time_ns()
+                if self.limiter.acquire():
+                    record_span('quota.wait', started, time.time_ns())
+                try:
+                    return getattr(self.client, method)(**kwargs)
+                except Exception as e:
+                    if attempt == MAX_ATTEMPTS - 1 or not _is_retryable(e):
+                        raise
+                    call_span.set(attempts=attempt + 2)
+                    started = time.time_ns()
+                    time.sleep(min(60, 2 ** attempt) + random.random())
+                    record_span('retry.backoff', started, time.time_ns(), error=type(e).__name__)
+    
+    def list_records(self, method: str, field: str, convert: Callable,
+                     parent: Optional[str] = None) -> Iterator:
+        """
+        Page through a list call, yielding convert(item) for each item.
+
+        Every page goes through call(), so paging is rate-limited and
+        retried too, and each page's protos are dropped once converted.
+        """
+        page_token = ''
+        while True:
+            page = self.call(method, request={
+                'parent': parent or self.property_path,
+                'page_size': LIST_PAGE_SIZE,
+                'page_token': page_token,
+            })
+            for item in getattr(page, field):
+                yield convert(item)
+            page_token = page.next_page_token
+            if not page_token:
+                return
+    
+    def iter_custom_dimensions(self) -> Iterator[CustomDimensionRecord]:
+        return self.list_records('list_custom_dimensions', 'custom_dimensions', CustomDimensionRecord)
+    
+    def iter_conversion_event_names(self) -> Iterator[str]:
+        return self.list_records('list_conversion_events', 'conversion_events', lambda event: event.event_name)
+    
+    def iter_audience_names(self) -> Iterator[str]:
+        return self.list_records('list_audiences', 'audiences', lambda audience: audience.display_name)
+    
+    def iter_audiences(self) -> Iterator[AudienceRecord]:
+        return self.list_records('list_audiences', 'audiences', AudienceRecord)
+    
+    def iter_web_streams(self) -> Iterator[WebStreamRecord]:
+        """Web data streams only; app streams have no enhanced measurement"""
+        from google.analytics.admin_v1alpha import DataStream
+        
+        web = DataStream.DataStreamType.WEB_DATA_STREAM
+        streams = self.list_records(
+            'list_data_streams', 'data_streams',
+            lambda stream: WebStreamRecord(stream) if stream.type_ == web else None,
+        )
+        return (stream for stream in streams if stream is not None)
+    
+    def iter_access_bindings(self, parent: str) -> Iterator[AccessBindingRecord]:
+        """Direct user bindings on an account or property"""
+        bindings = self.list_records('list_access_bindings', 'access_bindings', AccessBindingRecord, parent)
+        return (binding for binding in bindings if binding.user)
+    
+    def create_custom_dimensions(self):
+        """Create custom dimensions"""
+        from google.analytics.admin_v1beta import CustomDimension
+        
+        print("\n📊 Creating Custom Dimensions...")
+        
+        # List existing dimensions
+        existing_params = {dim.parameter_name for dim in self.iter_custom_dimensions()}
+        
+        created = 0
+        for dim_config in CUSTOM_DIMENSIONS:
+            if dim_config['parameter_name'] in existing_params:
+                print(f"  ⏭️  {dim_config['display_name']} already exists")
+                continue
+            
+            try:
+                # Map string scope to enum
+                scope_map = {
+                    'EVENT': CustomDimension.DimensionScope.EVENT,
+                    'USER': CustomDimension.DimensionScope.USER
+                }
+                
+                dimension = CustomDimension(
+                    parameter_name=dim_config['parameter_name'],
+                    display_name=dim_config['display_name'],
+                    description=dim_config['description'],
+                    scope=scope_map[dim_config['scope']]
+                )
+                
+                self.call(
+                    'create_custom_dimension',
+                    parent=self.property_path,
+                    custom_dimension=dimension
+                )
+                
+                print(f"  ✅ Created: {dim_config['display_name']}")
+                created += 1
+                
+            except Exception as e:
+                print(f"  ❌ Failed to create {dim_config['display_name']}: {e}")
+        
+        print(f"\n  Created {created} new dimensions")
+    
+    def mark_conversions(self):
+        """Mark events as conversions"""
+        from google.analytics.admin_v1beta import ConversionEvent
+        
+        print("\n🎯 Marking Conversion Events...")
+        
+        marked = 0
+        for event_name in CONVERSION_EVENTS:
+            try:
+                conversion_event = ConversionEvent(
+                    name=f"{self.property_path}/conversionEvents/{event_name}",
+                    event_name=event_name
+                )
+                
+                self.call(
+                    'create_conversion_event',
+                    parent=self.property_path,
+                    conversion_event=conversion_event
+                )
+                
+                print(f"  ✅ Marked as conversion: {event_name}")
+                marked += 1
+                
+            except Exception as e:
+                if "already exists" in str(e):
+                    print(f"  ⏭️  {event_name} already marked as conversion")
+                else:
+                    print(f"  ❌ Failed to mark {event_name}: {e}")
+        
+        print(f"\n  Marked {marked} new conversion events")
+    
+    def run_setup(self):
+        """Run the complete setup"""
+        print(f"\n🚀 Setting up GA4 for property: {self.property_id}\n")
+        
+        try:
+            with span('run_setup', target=self.property_id):
+                # Verify property exists
+                with span('get_property'):
+                    property = self.call('get_property', name=self.property_path)
+                print(f"✅ Found property: {property.display_name}")
+                
+                # Run setup steps
+                with span('create_custom_dimensions'):
+                    self.create_custom_dimensions()
+                with span('mark_conversions'):
+                    self.mark_conversions()
+            
+            print("\n✨ Setup completed successfully!")
+            print("\n📝 Manual steps still required:")
+            print("1. Go to Admin → Data Streams → Enhanced measurement")
+            print("2. Enable all enhanced measurement options")
+            print("3. Create custom reports in Reports → Library")
+            print("4. Set up custom funnels for your conversion paths")
+            
+        except Exception as e:
+            print(f"\n❌ Setup failed: {e}")
+            return False
+        
+        return True
+
+
+def build_admin_client(credentials=None):
+    """Admin API client for the given credentials (or application default)"""
+    from google.analytics.admin import AnalyticsAdminServiceClient
+    
+    if credentials:
+        return AnalyticsAdminServiceClient(credentials=credentials)
+    return AnalyticsAdminServiceClient()
+
+
+def load_credentials(auth: bool = False, service_account_file: Optional[str] = None,
+                     manage_users: bool = False):
+    """Credentials from OAuth2 (--auth), a service account file or the environment"""
+    with span('auth'):
+        return _load_credentials(auth, service_account_file, manage_users)
+
+
+def _load_credentials(auth: bool, service_account_file: Optional[str], manage_users: bool):
+    scopes = USER_MANAGEMENT_SCOPES if manage_users else SCOPES
+    if auth:
+        print("🔐 Authenticating with OAuth2...")
+        if manage_users:
+            return authenticate_oauth(scopes, get_token_path('token-users.json'))
+        return authenticate_oauth(scopes)
+    if service_account_file:
+        from google.oauth2 import service_account
+        
+        print(f"🔐 Using service account: {service_account_file}")
+        return service_account.Credentials.from_service_account_file(
+            service_account_file,
+            scopes=scopes
+        )
+    if os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+        print("🔐 Using service account from GOOGLE_APPLICATION_CREDENTIALS")
+        # Client will auto-detect from env var
+    return None
+
+
+class CredentialPool:
+    """
+    Admin API clients for several identities, keyed by tenant.
+
+    Properties and accounts are mapped to tenants; a property that isn't
+    mapped itself goes to the tenant of its parent account, looked up once
+    with get_property. Each tenant's credentials are loaded (and refreshed,
+    for OAuth) the first time one of its properties is used. Workers then
+    share that tenant's client and rate limiter, since Admin API quotas are
+    per Cloud project.
+
+    Tenant sources:
+       {"service_account": "/path/key.json"}
+       {"oauth": {"client_secrets": "/path/client.json", "token": "~/.ga4/client-a.json"}}
+       {"application_default": true}
+    """
+
+    def __init__(self, tenants: Dict[str, Dict], properties: Optional[Dict[str, str]] = None,
+                 accounts: Optional[Dict[str, str]] = None, default: Optional[str] = None,
+                 scopes: List[str] = SCOPES, qps: float = DEFAULT_QPS):
+        self.tenants = tenants
+        self.properties = {str(k): v for k, v in (properties or {}).items()}
+        self.accounts = {str(k): v for k, v in (accounts or {}).items()}
+        self.default = default
+        self.scopes = scopes
+        self.qps = qps
+        self._clients: Dict[str, object] = {}
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._parent_accounts: Dict[str, Optional[str]] = {}
+        self._tenant_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        # OAuth consent flows open a browser and wait for the user, so only one runs at a time
+        self._consent_lock = threading.Lock()
+
+        routed = {*self.properties.values(), *self.accounts.values()} | ({default} if default else set())
+        unknown = routed - set(tenants)
+        if unknown:
+            raise ValueError(f"Routes refer to undefined tenants: {', '.join(sorted(unknown))}")
+
+    @classmethod
+    def from_file(cls, path: str, scopes: List[str] = SCOPES, qps: float = DEFAULT_QPS) -> 'CredentialPool':
+        """Load {tenants, properties, accounts, default} from a JSON file"""
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config['tenants'], config.get('properties'), config.get('accounts'),
+                   config.get('default'), scopes, qps)
+
+    def tenant_for(self, parent: str) -> str:
+        """Tenant for 'properties/123' or 'accounts/456' (or a bare property ID)"""
+        kind, _, resource_id = parent.rpartition('/')
+        if kind == 'accounts':
+            tenant = self.accounts.get(resource_id, self.default)
+        elif resource_id in self.properties:
+            tenant = self.properties[resource_id]
+        else:
+            account = self.parent_account(resource_id) if self.accounts else None
+            tenant = self.accounts.get(account, self.default)
+        if tenant is None:
+            raise ValueError(f"No tenant configured for {parent} and no default tenant")
+        return tenant
+
+    def parent_account(self, property_id: str) -> Optional[str]:
+        """
+        ID of the account a property belongs to, or None if no account tenant can read it.
+
+        Asks each tenant that accounts are routed to (the default first), so
+        a property under a mapped account is found with that account's
+        credentials. Cached per property.
+        """
+        with self._lock:
+            if property_id in self._parent_accounts:
+                return self._parent_accounts[property_id]
+
+        from google.api_core import exceptions
+
+        account = None
+        candidates = ([self.default] if self.default in self.accounts.values() else []) + list(self.accounts.values())
+        for tenant in dict.fromkeys(candidates):
+            try:
+                parent = self.automation_for_tenant(tenant, property_id).call(
+                    'get_property', name=f"properties/{property_id}").parent
+            except (exceptions.PermissionDenied, exceptions.NotFound):
+                continue
+            account = parent.rpartition('/')[2]
+            break
+        with self._lock:
+            self._parent_accounts[property_id] = account
+        return account
+
+    def load_credentials(self, tenant: str):
+        source = self.tenants[tenant]
+        if 'service_account' in source:
+            from google.oauth2 import service_account
+
+            print(f"🔐 [{tenant}] Using service account: {source['service_account']}")
+            return service_account.Credentials.from_service_account_file(
+                os.path.expanduser(source['service_account']), scopes=self.scopes)
+        if 'oauth' in source:
+            oauth = source['oauth']
+            client_config = None
+            if oauth.get('client_secrets'):
+                with open(os.path.expanduser(oauth['client_secrets'])) as f:
+                    client_config = json.load(f)
+            if oauth.get('token'):
+                token_path = Path(oauth['token']).expanduser()
+            else:
+                suffix = '-users' if self.scopes == USER_MANAGEMENT_SCOPES else ''
+                token_path = get_token_path(f"token-{tenant}{suffix}.json")
+            print(f"🔐 [{tenant}] Authenticating with OAuth2...")
+            return authenticate_oauth(self.scopes, token_path, client_config)
+        if source.get('application_default'):
+            return None
+        raise ValueError(f"Tenant {tenant} has no credential source")
+
+    def client(self, tenant: str):
+        """The tenant's client, created on first use"""
+        client = self._clients.get(tenant)
+        if client is not None:
+            return client
+
+        # Only workers waiting for this tenant block while it loads
+        with self._lock:
+            tenant_lock = self._tenant_locks.setdefault(tenant, threading.Lock())
+        with tenant_lock:
+            if tenant not in self._clients:
+                with span('auth', tenant=tenant):
+                    if 'oauth' in self.tenants[tenant]:
+                        with self._consent_lock:
+                            credentials = self.load_credentials(tenant)
+                    else:
+                        credentials = self.load_credentials(tenant)
+                    client = build_admin_client(credentials)
+                # The limiter is in place before the client is visible to the fast path
+                self._limiters[tenant] = RateLimiter(self.qps)
+                self._clients[tenant] = client
+            return self._clients[tenant]
+
+    def automation_for_tenant(self, tenant: str, property_id: str) -> GA4SetupAutomation:
+        client = self.client(tenant)
+        return GA4SetupAutomation(property_id, client=client, limiter=self._limiters[tenant])
+
+    def automation(self, property_id: str, parent: Optional[str] = None) -> GA4SetupAutomation:
+        """GA4SetupAutomation wired to the client and limiter of the owning tenant"""
+        return self.automation_for_tenant(self.tenant_for(parent or f"properties/{property_id}"), property_id)
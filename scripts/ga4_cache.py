@@ -0,0 +1,192 @@
+"""
+GA4 Report Cache Module - on-disk, content-addressed cache for run_report
+
+Responses are stored under the SHA-256 of the normalized request:
+
+   <cache>/ab/ab12...ef.pb
+
+Each file holds an 8-byte store timestamp followed by the serialized
+RunReportResponse. Whether a cached response is still fresh depends on
+how recent the request's date range is:
+
+- Ranges that ended before the processing window (GA4 keeps updating
+  data for ~48 hours) are closed. Their results never change, so they
+  never expire.
+- Ranges that end inside the window expire after RECENT_TTL.
+- Ranges that include today expire after TODAY_TTL.
+
+The cache is bounded by size. Hits refresh a file's mtime, and the least
+recently used files are evicted first.
+"""
+import hashlib
+import os
+import struct
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_CACHE_DIR = 'ga4-cache'
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Days after which a date is closed; matches ga4_sync's DEFAULT_REFRESH_DAYS
+CLOSED_AFTER_DAYS = 3
+
+# Seconds a response stays fresh when its range ends inside the processing window
+RECENT_TTL = 3600
+
+# Seconds a response stays fresh when its range includes today
+TODAY_TTL = 300
+
+# Eviction trims the cache to this fraction of max_bytes, so it doesn't run on every put
+EVICT_TO = 0.9
+
+_HEADER = struct.Struct('<d')
+
+
+def get_cache_path(path: Optional[str] = None) -> Path:
+    """Cache location from --cache-dir, GA4_REPORT_CACHE or ./ga4-cache"""
+    return Path(path or os.getenv('GA4_REPORT_CACHE') or DEFAULT_CACHE_DIR)
+
+
+def request_key(request) -> str:
+    """SHA-256 of the request with sorted keys; equal queries share a key"""
+    canonical = type(request).to_json(request, sort_keys=True, indent=None)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def ttl_for(request, today: Optional[date] = None) -> Optional[float]:
+    """Seconds a response stays fresh, or None if its date ranges are all closed"""
+    today = today or date.today()
+    latest = None
+    for date_range in request.date_ranges:
+        try:
+            end = date.fromisoformat(date_range.end_date)
+        except ValueError:
+            # Relative dates ('today', 'yesterday', 'NdaysAgo') move every day
+            return TODAY_TTL
+        latest = end if latest is None else max(latest, end)
+    if latest is None or latest >= today:
+        return TODAY_TTL
+    if latest > today - timedelta(days=CLOSED_AFTER_DAYS):
+        return RECENT_TTL
+    return None
+
+
+class ReportCache:
+    """Size-bounded LRU cache of RunReportResponses, safe to share between threads"""
+
+    def __init__(self, path: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evicted': 0}
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.pb"
+
+    def get(self, request):
+        """Cached response for `request` if present and fresh, else None"""
+        from google.analytics.data_v1beta.types import RunReportResponse
+        from google.protobuf.message import DecodeError
+
+        file_path = self._file(request_key(request))
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+
+        try:
+            (stored_at,) = _HEADER.unpack_from(data)
+            ttl = ttl_for(request)
+            if ttl is not None and time.time() - stored_at > ttl:
+                self._count('stale')
+                return None
+            response = RunReportResponse.deserialize(data[_HEADER.size:])
+        except (struct.error, DecodeError):
+            # Truncated or corrupt entry (e.g. a crash mid-write on a filesystem without atomic rename)
+            self._count('misses')
+            try:
+                file_path.unlink()
+            except FileNotFoundError:
+                return None
+            with self._lock:
+                if self._size is not None:
+                    self._size -= len(data)
+            return None
+
+        try:
+            # Marks the entry as recently used for eviction
+            os.utime(file_path)
+        except FileNotFoundError:
+            pass
+        self._count('hits')
+        return response
+
+    def put(self, request, response):
+        """Store a response; evicts least recently used entries when over max_bytes"""
+        data = _HEADER.pack(time.time()) + type(response).serialize(response)
+        file_path = self._file(request_key(request))
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Written under a unique name and renamed, so readers never see partial files
+        tmp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        try:
+            replaced = file_path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, file_path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_size()
+            else:
+                self._size += len(data) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _entries(self):
+        return list(self.path.glob('*/*.pb'))
+
+    def _disk_size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def _evict(self):
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort()
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_bytes * EVICT_TO
+        for _, entry_size, entry in entries:
+            if size <= target:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            self.stats['evicted'] += 1
+        self._size = size
+
+    def clear(self):
+        for entry in self._entries():
+            entry.unlink()
+        with self._lock:
+            self._size = 0
@@ -0,0 +1,213 @@
+"""
+GA4 Cassette Module - record and replay Admin / Data API traffic
+
+A RecordingClient wraps a real API client and appends every call to a
+cassette, a JSONL file with one interaction per line:
+
+   {"method": "run_report", "request": "{...}", "latency": 0.412,
+    "response_type": "google.analytics.data_v1beta.types...RunReportResponse",
+    "response": "<base64 serialized proto>"}
+
+Failed calls are recorded with the API error's class, status code and
+message instead of a response. For list calls, the page the pager wraps is
+recorded, which is all GA4SetupAutomation.list_records() reads.
+
+A ReplayClient serves a cassette back without network access or
+credentials. Each call sleeps for the recorded latency divided by
+`speed` (1.0 replays the original timing, 0 disables the delays), so
+provisioning and report runs can be profiled offline against real-shaped
+traffic. Calls are matched by method and request; a request that was not
+recorded is served the same method's recorded responses in turn, so a
+cassette still replays when, for example, relative report dates resolve
+to a different day.
+
+Both clients stand in for the client= argument of GA4SetupAutomation and
+ReportRunner.
+"""
+import atexit
+import base64
+import importlib
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+# Call options that don't change what the API returns
+IGNORED_KWARGS = ('retry', 'timeout', 'metadata')
+
+
+def _jsonable(value):
+    if hasattr(type(value), 'pb') and hasattr(type(value), 'to_dict'):
+        # proto-plus message
+        return type(value).to_dict(value, preserving_proto_field_name=True)
+    if hasattr(value, 'DESCRIPTOR'):
+        # raw protobuf message, e.g. FieldMask
+        from google.protobuf.json_format import MessageToDict
+
+        return MessageToDict(value, preserving_proto_field_name=True)
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+def request_key(kwargs: Dict) -> str:
+    """Canonical JSON of a call's arguments; equal requests share a key"""
+    arguments = {key: value for key, value in kwargs.items() if key not in IGNORED_KWARGS}
+    return json.dumps(_jsonable(arguments), sort_keys=True, default=str)
+
+
+def _type_name(message) -> str:
+    return f"{type(message).__module__}.{type(message).__qualname__}"
+
+
+def _load_type(name: str):
+    module, _, qualname = name.rpartition('.')
+    # Nested message types have dotted qualnames
+    while module:
+        try:
+            target = importlib.import_module(module)
+            break
+        except ImportError:
+            module, _, outer = module.rpartition('.')
+            qualname = f"{outer}.{qualname}"
+    for part in qualname.split('.'):
+        target = getattr(target, part)
+    return target
+
+
+class CassetteWriter:
+    """Appends interactions to a cassette file; shared by all recording clients of a run"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file = open(path, 'w')
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def write(self, interaction: Dict):
+        line = json.dumps(interaction) + '\n'
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+                self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class RecordingClient:
+    """Passes calls through to `client` and records them to `writer`"""
+
+    def __init__(self, client, writer: CassetteWriter):
+        self._client = client
+        self._writer = writer
+
+    def __getattr__(self, method: str):
+        target = getattr(self._client, method)
+        if not callable(target):
+            return target
+
+        def record(**kwargs):
+            from google.api_core import exceptions
+
+            interaction = {'method': method, 'request': request_key(kwargs)}
+            started = time.perf_counter()
+            try:
+                response = target(**kwargs)
+            except exceptions.GoogleAPICallError as e:
+                interaction['latency'] = time.perf_counter() - started
+                interaction['error'] = {'type': type(e).__name__, 'code': e.code, 'message': e.message}
+                self._writer.write(interaction)
+                raise
+            interaction['latency'] = time.perf_counter() - started
+
+            # Pagers fetch further pages lazily; keep the page they wrap
+            message = getattr(response, '_response', response)
+            if message is not None:
+                interaction['response_type'] = _type_name(message)
+                interaction['response'] = base64.b64encode(type(message).serialize(message)).decode()
+            self._writer.write(interaction)
+            return response
+
+        return record
+
+
+class ReplayClient:
+    """Serves a recorded cassette back in place of an API client"""
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self.stats = {'served': 0, 'unmatched': 0, 'slept': 0.0}
+        self._by_request = defaultdict(deque)
+        self._by_method = defaultdict(deque)
+        self._lock = threading.Lock()
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    self._by_request[interaction['method'], interaction['request']].append(interaction)
+                    self._by_method[interaction['method']].append(interaction)
+
+    def _next(self, method: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            recorded = self._by_request.get((method, key))
+            if recorded:
+                # Repeated requests (retries, re-reads) replay in recorded order; the last one sticks
+                interaction = recorded.popleft() if len(recorded) > 1 else recorded[0]
+            elif self._by_method.get(method):
+                self.stats['unmatched'] += 1
+                interaction = self._by_method[method][0]
+                self._by_method[method].rotate(-1)
+            else:
+                return None
+            self.stats['served'] += 1
+            return interaction
+
+    def __getattr__(self, method: str):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def replay(**kwargs):
+            from google.api_core import exceptions
+
+            interaction = self._next(method, request_key(kwargs))
+            if interaction is None:
+                raise LookupError(f"{method} was never called in cassette {self.path}")
+
+            if self.speed:
+                delay = interaction['latency'] / self.speed
+                with self._lock:
+                    self.stats['slept'] += delay
+                time.sleep(delay)
+
+            error = interaction.get('error')
+            if error:
+                # Same exception class as recorded, so retry policies treat it the same way
+                error_type = getattr(exceptions, error['type'], None)
+                if error_type is None:
+                    raise exceptions.from_http_status(error['code'] or 500, error['message'])
+                raise error_type(error['message'])
+            if 'response' not in interaction:
+                return None
+            message_type = _load_type(interaction['response_type'])
+            return message_type.deserialize(base64.b64decode(interaction['response']))
+
+        return replay
+
+
+def add_cassette_arguments(parser):
+    """Add the --record / --replay / --replay-speed flags"""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', metavar='CASSETTE', help='Record every API call to this JSONL cassette')
+    group.add_argument('--replay', metavar='CASSETTE',
+                       help='Serve API calls from a recorded cassette instead of Google (no credentials)')
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help='Replay latencies divided by this factor (1: original timing, 0: no delays)')
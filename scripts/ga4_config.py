@@ -60,21 +60,70 @@ def get_oauth_credentials():
     sys.exit(1)
 
 
-def get_token_path():
+def get_token_path(filename='token.json'):
     """
     Get path for storing OAuth2 token.
     Uses GA4_TOKEN_PATH environment variable or defaults to ~/.ga4/token.json
+
+    Tokens for other scope sets (e.g. read-only reporting) pass a different
+    filename and are stored next to the default token.
     """
     token_path = os.getenv('GA4_TOKEN_PATH')
     if token_path:
+        if filename != 'token.json':
+            return Path(token_path).with_name(filename)
         return Path(token_path)
     
     # Default to user's home directory
-    default_path = Path.home() / '.ga4' / 'token.json'
+    default_path = Path.home() / '.ga4' / filename
     default_path.parent.mkdir(parents=True, exist_ok=True)
     return default_path
 
 
+def authenticate_oauth(scopes, token_path=None, client_config=None):
+    """
+    Authenticate using OAuth2 flow with secure credential management
+
+    client_config overrides get_oauth_credentials(), for tools that hold
+    several OAuth clients (one per tenant) at once.
+    """
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    
+    creds = None
+    token_path = token_path or get_token_path()
+    
+    # Load existing token
+    if token_path.exists():
+        try:
+            creds = Credentials.from_authorized_user_file(str(token_path), scopes)
+        except:
+            pass
+    
+    # If there are no (valid) credentials, let the user log in
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            # Get credentials configuration
+            creds_config = client_config or get_oauth_credentials()
+            
+            # Create flow from config dict instead of file
+            flow = InstalledAppFlow.from_client_config(
+                creds_config, scopes)
+            creds = flow.run_local_server(port=0)
+        
+        # Save the credentials for the next run
+        token_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(token_path, 'w') as token:
+            token.write(creds.to_json())
+        
+        print(f"✅ Token saved to: {token_path}")
+    
+    return creds
+
+
 def save_credentials_to_env_example():
     """
     Create an example .env file for GA4 credentials
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+GA4 Provisioning Daemon - warm Admin API clients behind a local endpoint
+
+Every setup or fleet invocation pays for the Python start, the google
+client imports, credential loading and channel setup before its first
+RPC. `serve` pays that once and keeps everything warm:
+
+- the Admin API clients and rate limiters (one per tenant with --tenants)
+- the fleet state (ga4_state.py), so unchanged properties are skipped after
+  one change-history call
+- template snapshots read with `source`, for TEMPLATE_TTL seconds
+
+Requests are JSON POSTs to /plan, /apply and /export, over a Unix socket
+that only the daemon's user can open (or, with --port, unauthenticated TCP
+on 127.0.0.1). Applies to the same property are serialised, so
+overlapping requests never plan and create the same resources twice. The
+client commands here are thin: they send one request and print the
+per-property results, so a deploy hook costs its own RPCs plus a local
+round trip.
+
+Request body:
+   {"properties": ["123", "456"],      plan/apply/export targets
+    "source": "789" | "template": {...} desired state from a template
+                                       property or an exported snapshot
+                                       (default: CUSTOM_DIMENSIONS /
+                                       CONVERSION_EVENTS)
+    "force": false,                    ignore the fleet state
+    "refresh": false}                  re-read `source` even if cached
+
+Usage:
+   python ga4_daemon.py serve --auth [--socket=ga4-daemon.sock | --port=8788]
+   python ga4_daemon.py apply --properties=123,456 [--socket=ga4-daemon.sock]
+   python ga4_daemon.py plan --source=789 --properties-file=sites.txt
+   python ga4_daemon.py export --properties=123 -o config.json
+   python ga4_daemon.py status
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from ga4_admin import DEFAULT_QPS
+from ga4_cassette import add_cassette_arguments
+from ga4_fleet import (
+    DEFAULT_WORKERS,
+    automation_factory,
+    desired_from_defaults,
+    desired_from_snapshot,
+    open_state,
+    parse_property_ids,
+    plan_and_apply,
+    print_result,
+    read_property_config,
+    summarize,
+    traced,
+)
+from ga4_state import DEFAULT_STATE_FILE, FleetState
+from ga4_trace import configure as configure_tracing, span
+
+DEFAULT_SOCKET = 'ga4-daemon.sock'
+
+# Suggested --port; TCP is only used when a port is given
+DEFAULT_PORT = 8788
+
+# Seconds a template snapshot read from a source property is reused
+TEMPLATE_TTL = 300
+
+COMMANDS = ('plan', 'apply', 'export')
+
+
+class ProvisioningService:
+    """Handles plan/apply/export requests with long-lived clients and state"""
+
+    def __init__(self, automation: Callable, state: Optional[FleetState], max_workers: int = DEFAULT_WORKERS):
+        self.automation = automation
+        self.state = state
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.stats = {'started': time.time(), 'requests': 0, 'errors': 0, 'properties': 0, 'template_hits': 0}
+        self._templates = {}
+        self._property_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def desired(self, request: Dict) -> Dict:
+        if request.get('template'):
+            return desired_from_snapshot(request['template'])
+        source = request.get('source')
+        if not source:
+            return desired_from_defaults()
+
+        with self._lock:
+            cached = self._templates.get(source)
+        if cached and time.time() - cached[0] < TEMPLATE_TTL and not request.get('refresh'):
+            self._count('template_hits')
+            return cached[1]
+        with span('read_template', target=source):
+            desired = desired_from_snapshot(read_property_config(self.automation(source)))
+        with self._lock:
+            self._templates[source] = (time.time(), desired)
+        return desired
+
+    def property_lock(self, property_id: str) -> threading.Lock:
+        with self._lock:
+            return self._property_locks.setdefault(property_id, threading.Lock())
+
+    def apply(self, property_id: str, desired: Dict, force: bool) -> Dict:
+        # Held across plan and apply: a second request waits, then plans against the first one's writes
+        with self.property_lock(property_id):
+            return plan_and_apply(self.automation(property_id), desired, False, self.state, force)
+
+    def run_properties(self, property_ids: List[str], task: Callable[[str], Dict]) -> Dict[str, Dict]:
+        """task(property_id) across the shared worker pool; failures are captured per property"""
+        futures = {
+            property_id: self.executor.submit(traced(task, property_id), property_id)
+            for property_id in property_ids
+        }
+        results = {}
+        for property_id, future in futures.items():
+            try:
+                results[property_id] = future.result()
+            except Exception as e:
+                results[property_id] = {'error': str(e)}
+        self._count('properties', len(results))
+        return results
+
+    def handle(self, command: str, request: Dict) -> Dict:
+        self._count('requests')
+        property_ids = [str(p) for p in request.get('properties') or []]
+        if not property_ids:
+            raise ValueError("'properties' must list at least one property ID")
+
+        with span(f"daemon.{command}", properties=len(property_ids)):
+            if command == 'export':
+                results = self.run_properties(property_ids, lambda p: read_property_config(self.automation(p)))
+            else:
+                desired = self.desired(request)
+                force = bool(request.get('force'))
+                if command == 'plan':
+                    # Dry runs still use the state to skip unchanged properties, but never update it
+                    results = self.run_properties(property_ids, lambda p: plan_and_apply(
+                        self.automation(p), desired, True, self.state, force))
+                else:
+                    try:
+                        results = self.run_properties(property_ids, lambda p: self.apply(p, desired, force))
+                    finally:
+                        self.save_state()
+
+        if any('error' in r or r.get('failed') for r in results.values()):
+            self._count('errors')
+        return {'results': results}
+
+    def save_state(self):
+        # No state under --replay (see open_state)
+        if self.state is not None:
+            self.state.save()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.save_state()
+
+
+async def serve(service: ProvisioningService, socket_path: Optional[str] = DEFAULT_SOCKET,
+                host: str = '127.0.0.1', port: Optional[int] = None):
+    """Serve POST /plan, /apply, /export and GET /stats until SIGINT/SIGTERM"""
+
+    async def respond(writer: asyncio.StreamWriter, status: str, payload: Dict):
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path = request_line.decode('latin-1').split()[:2]
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    if key.strip().lower() == 'content-length':
+                        length = int(value)
+                body = await reader.readexactly(length) if length else b''
+
+                if method == 'GET' and path == '/stats':
+                    await respond(writer, '200 OK', dict(service.stats, uptime=time.time() - service.stats['started']))
+                    continue
+                command = path.strip('/')
+                if method != 'POST' or command not in COMMANDS:
+                    await respond(writer, '404 Not Found', {'error': 'POST /plan, /apply or /export'})
+                    continue
+
+                started = time.perf_counter()
+                try:
+                    # Admin API calls block; they run on threads while the loop keeps accepting
+                    result = await loop.run_in_executor(None, service.handle, command, json.loads(body or b'{}'))
+                except (ValueError, KeyError, TypeError) as e:
+                    await respond(writer, '400 Bad Request', {'error': str(e)})
+                    continue
+                except Exception as e:
+                    await respond(writer, '500 Internal Server Error', {'error': f"{type(e).__name__}: {e}"})
+                    continue
+                result['elapsed_ms'] = (time.perf_counter() - started) * 1000
+                await respond(writer, '200 OK', result)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    if port is None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        # Created 0600 from the start, so only the daemon's user can ever connect
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(handle, socket_path)
+        finally:
+            os.umask(umask)
+        print(f"✅ Provisioning daemon listening on {socket_path}")
+    else:
+        socket_path = None
+        server = await asyncio.start_server(handle, host, port)
+        print(f"✅ Provisioning daemon listening on http://{host}:{port} (any local user can connect)")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        try:
+            self.sock.connect(self.socket_path)
+        except FileNotFoundError:
+            raise ConnectionRefusedError(f"{self.socket_path} does not exist")
+
+
+def request(method: str, path: str, payload: Optional[Dict] = None, socket_path: str = DEFAULT_SOCKET,
+            port: Optional[int] = None) -> Dict:
+    """One request to a running daemon; raises on connection or HTTP errors"""
+    if port is None:
+        connection = UnixHTTPConnection(socket_path)
+    else:
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+    try:
+        body = json.dumps(payload).encode() if payload is not None else None
+        connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        data = json.loads(response.read() or b'{}')
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise RuntimeError(data.get('error') or f"HTTP {response.status}")
+    return data
+
+
+def run_server(args):
+    if args.trace:
+        configure_tracing(args.trace)
+    automation = automation_factory(args)
+    if not args.tenants:
+        # Credentials are loaded and the client created now, not on the first request
+        automation('0')
+    service = ProvisioningService(automation, open_state(args), args.workers)
+    try:
+        asyncio.run(serve(service, args.socket, port=args.port))
+    finally:
+        service.close()
+        print("\n👋 Daemon stopped")
+
+
+def run_client(args):
+    address = {'socket_path': args.socket, 'port': args.port}
+    if args.command == 'status':
+        stats = request('GET', '/stats', **address)
+        print(f"📊 Up {stats['uptime']:.0f}s: {stats['requests']} requests, {stats['properties']} properties, "
+              f"{stats['template_hits']} cached templates, {stats['errors']} with failures")
+        return
+
+    payload = {'properties': parse_property_ids(args.properties, args.properties_file)}
+    if args.command != 'export':
+        if args.from_file:
+            with open(args.from_file) as f:
+                payload['template'] = json.load(f)
+        elif args.source:
+            payload['source'] = args.source
+            payload['refresh'] = args.refresh
+        payload['force'] = args.force
+
+    response = request('POST', f"/{args.command}", payload, **address)
+    results = response['results']
+
+    if args.command == 'export':
+        output = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            if len(results) == 1:
+                output.write(json.dumps(next(iter(results.values())), indent=2) + '\n')
+            else:
+                for snapshot in results.values():
+                    output.write(json.dumps(snapshot) + '\n')
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        failed = sum('error' in snapshot for snapshot in results.values())
+        sys.exit(0 if not failed else 1)
+
+    for property_id, result in results.items():
+        print_result(property_id, result)
+    ok = summarize(results)
+    print(f"⏱️  {response['elapsed_ms']:.0f}ms in the daemon")
+    sys.exit(0 if ok else 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Long-lived GA4 provisioning daemon and its client')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'Unix socket path (default: {DEFAULT_SOCKET})')
+    parser.add_argument('--port', type=int,
+                        help=f'Use unauthenticated TCP on 127.0.0.1:PORT (e.g. {DEFAULT_PORT}) instead of the socket')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='Run the daemon')
+    serve_parser.add_argument('--auth', action='store_true', help='Use OAuth2 authentication')
+    serve_parser.add_argument('--service-account', help='Path to service account JSON file')
+    serve_parser.add_argument('--tenants', help='JSON file mapping properties/accounts to credentials')
+    serve_parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Properties processed concurrently')
+    serve_parser.add_argument('--qps', type=float, default=DEFAULT_QPS, help='Admin API calls per second')
+    serve_parser.add_argument('--state',
+                              help=f'Fleet state file (default: GA4_FLEET_STATE or ./{DEFAULT_STATE_FILE})')
+    serve_parser.add_argument('--trace', help='Append trace spans to this JSONL file')
+    add_cassette_arguments(serve_parser)
+
+    for command in COMMANDS:
+        command_parser = commands.add_parser(command, help=f"{command.capitalize()} properties through the daemon")
+        command_parser.add_argument('--properties', help='Comma-separated property IDs')
+        command_parser.add_argument('--properties-file', help='File with one property ID per line')
+        if command == 'export':
+            command_parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+        else:
+            command_parser.add_argument('--source', help='Template property ID (cached by the daemon)')
+            command_parser.add_argument('--refresh', action='store_true',
+                                        help=f'Re-read --source even if the daemon cached it less than {TEMPLATE_TTL}s ago')
+            command_parser.add_argument('--from-file', help='Exported template JSON')
+            command_parser.add_argument('--force', action='store_true',
+                                        help='Re-check properties even if unchanged since last apply')
+    commands.add_parser('status', help="Show the daemon's uptime and request counts")
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        run_server(args)
+        return
+    try:
+        run_client(args)
+    except ConnectionError as e:
+        print(f"❌ No daemon at {args.socket if args.port is None else f'127.0.0.1:{args.port}'}: {e}")
+        sys.exit(1)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
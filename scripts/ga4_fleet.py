@@ -0,0 +1,942 @@
+#!/usr/bin/env python3
+"""
+GA4 Fleet Tooling - export, clone and apply configuration across many properties
+
+Commands:
+   export  Read properties' full configuration and write it as JSON (one
+           property) or JSONL (many, streamed): custom dimensions, conversion
+           events, audiences, data retention and web stream enhanced
+           measurement settings.
+   clone   Read a template property once, then bring N target properties in
+           line with it concurrently, skipping anything already present.
+   apply   Apply the repo's CUSTOM_DIMENSIONS and CONVERSION_EVENTS to many
+           properties concurrently.
+   access  Grant or revoke user access on many properties or accounts. Each
+           one's bindings are diffed first, then changed with at most one
+           batch create, update and delete call.
+   prune   Archive custom dimensions and audiences that are no longer
+           wanted (not in CUSTOM_DIMENSIONS / ga4-config.json, or not in a
+           template), after showing the plan and asking for confirmation.
+   worker  Claim clone/apply jobs submitted with --queue from a shared queue
+           (see ga4_queue.py) until it is drained. Run any number of
+           workers, on any number of hosts.
+   queue-status  Show a queue's job counts and failures.
+
+All commands share one Admin API client, one rate limiter and the same
+retry policy (see ga4_admin.py); with --tenants, there is one client and
+limiter per credential source instead. --dry-run prints the plan without writing.
+clone and apply skip properties that are unchanged since their last apply
+(see ga4_state.py); --force checks them anyway.
+
+Usage:
+   python ga4_fleet.py --auth export --property-id=123 -o template.json
+   python ga4_fleet.py --auth clone --source=123 --targets=456,789 [--dry-run]
+   python ga4_fleet.py --auth apply --properties-file=sites.txt
+   python ga4_fleet.py --auth access --users=analyst@agency.com --roles=analyst --properties-file=sites.txt
+   python ga4_fleet.py --auth prune --properties-file=sites.txt [--dry-run | --yes]
+   python ga4_fleet.py apply --properties-file=sites.txt --queue=sqlite:///fleet-queue.db
+   python ga4_fleet.py --auth worker --queue=sqlite:///fleet-queue.db
+   python ga4_fleet.py --auth --record=run.jsonl apply --properties-file=sites.txt
+   python ga4_fleet.py --replay=run.jsonl --replay-speed=0 apply --properties-file=sites.txt
+"""
+
+import argparse
+import contextvars
+import json
+import os
+import socket
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from ga4_admin import (
+    CONVERSION_EVENTS,
+    CUSTOM_DIMENSIONS,
+    DEFAULT_QPS,
+    SCOPES,
+    USER_MANAGEMENT_SCOPES,
+    AccessBindingRecord,
+    CredentialPool,
+    GA4SetupAutomation,
+    RateLimiter,
+    build_admin_client,
+    load_credentials,
+)
+from ga4_cassette import CassetteWriter, RecordingClient, ReplayClient, add_cassette_arguments
+from ga4_mp import DEFAULT_CONFIG_PATH, load_tracking_config
+from ga4_queue import DEFAULT_LEASE_SECONDS, DEFAULT_QUEUE_NAME, LeaseKeeper, LeaseLost, open_queue
+from ga4_state import (
+    DEFAULT_STATE_FILE,
+    FleetState,
+    current_cursor,
+    fingerprint,
+    get_state_path,
+    is_unchanged,
+)
+from ga4_trace import configure as configure_tracing, span
+
+# Properties processed at once; each worker's calls still share the rate limiter
+DEFAULT_WORKERS = 8
+
+# Audience fields GA4 sets itself and rejects on create
+AUDIENCE_OUTPUT_FIELDS = ('name', 'create_time', 'ads_personalization_enabled')
+
+RETENTION_FIELDS = ('event_data_retention', 'user_data_retention', 'reset_user_data_on_new_activity')
+
+# Predefined audiences every property has; GA4 refuses to archive them
+PROTECTED_AUDIENCES = {'All Users', 'Purchasers'}
+
+# Short role names on the command line expand to predefined roles
+ROLE_PREFIX = 'predefinedRoles/'
+
+# Admin API limit on requests in one batch access-binding call
+MAX_ACCESS_BINDINGS_PER_BATCH = 1000
+
+# Seconds an idle queue worker waits before checking for expired leases again
+QUEUE_POLL_SECONDS = 5
+
+
+def audience_definition(audience) -> Dict:
+    """Audience proto as a dict that create_audience accepts"""
+    from google.analytics.admin_v1alpha import Audience
+
+    data = Audience.to_dict(audience, preserving_proto_field_name=True)
+    for field in AUDIENCE_OUTPUT_FIELDS:
+        data.pop(field, None)
+    return data
+
+
+def read_data_retention(automation: GA4SetupAutomation) -> Dict:
+    from google.analytics.admin_v1alpha import DataRetentionSettings
+
+    retention = automation.call(
+        'get_data_retention_settings', name=f"{automation.property_path}/dataRetentionSettings")
+    return {
+        'event_data_retention': DataRetentionSettings.RetentionDuration(retention.event_data_retention).name,
+        'user_data_retention': DataRetentionSettings.RetentionDuration(retention.user_data_retention).name,
+        'reset_user_data_on_new_activity': retention.reset_user_data_on_new_activity,
+    }
+
+
+def iter_web_stream_settings(automation: GA4SetupAutomation) -> Iterator[Dict]:
+    """Web streams with their enhanced measurement settings"""
+    from google.analytics.admin_v1alpha import EnhancedMeasurementSettings
+
+    for stream in automation.iter_web_streams():
+        settings = automation.call(
+            'get_enhanced_measurement_settings', name=f"{stream.name}/enhancedMeasurementSettings")
+        enhanced = EnhancedMeasurementSettings.to_dict(settings, preserving_proto_field_name=True)
+        enhanced.pop('name', None)
+        yield dict(stream.to_dict(), enhanced_measurement=enhanced)
+
+
+def read_property_config(automation: GA4SetupAutomation) -> Dict:
+    """Full snapshot of a property's configuration, as plain JSON-able dicts"""
+    prop = automation.call('get_property', name=automation.property_path)
+    return {
+        'property': {
+            'name': prop.name,
+            'display_name': prop.display_name,
+            'time_zone': prop.time_zone,
+            'currency_code': prop.currency_code,
+        },
+        'custom_dimensions': [dim.to_dict() for dim in automation.iter_custom_dimensions()],
+        'conversion_events': sorted(automation.iter_conversion_event_names()),
+        'audiences': list(automation.list_records('list_audiences', 'audiences', audience_definition)),
+        'data_retention': read_data_retention(automation),
+        'web_streams': list(iter_web_stream_settings(automation)),
+    }
+
+
+def read_property_state(automation: GA4SetupAutomation, desired: Dict) -> Dict:
+    """
+    Just what plan_changes() compares: existing keys as sets, plus the
+    settings `desired` actually manages.
+    """
+    return {
+        'custom_dimensions': {dim.parameter_name for dim in automation.iter_custom_dimensions()},
+        'conversion_events': set(automation.iter_conversion_event_names()),
+        'audiences': set(automation.iter_audience_names()) if desired['audiences'] else set(),
+        'data_retention': read_data_retention(automation) if desired.get('data_retention') else None,
+        'web_streams': (
+            list(iter_web_stream_settings(automation)) if desired.get('enhanced_measurement') else []
+        ),
+    }
+
+
+def iter_exports(property_ids: List[str], automation: Callable[[str], GA4SetupAutomation],
+                 max_workers: int = DEFAULT_WORKERS) -> Iterator[Dict]:
+    """
+    Snapshots of many properties, in order, read max_workers at a time.
+
+    Only the snapshots in flight are held in memory, so exporting a large
+    fleet streams instead of accumulating.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for property_id in property_ids:
+            pending.append((property_id, executor.submit(
+                traced(read_property_config, property_id), automation(property_id))))
+            if len(pending) >= max_workers * 2:
+                yield export_result(*pending.popleft())
+        while pending:
+            yield export_result(*pending.popleft())
+
+
+def export_result(property_id: str, future) -> Dict:
+    try:
+        return future.result()
+    except Exception as e:
+        return {'property': {'name': f"properties/{property_id}"}, 'error': str(e)}
+
+
+def desired_from_snapshot(snapshot: Dict) -> Dict:
+    """Desired state for targets: the template's config minus property-specific bits"""
+    streams = snapshot.get('web_streams') or []
+    return {
+        'custom_dimensions': snapshot['custom_dimensions'],
+        'conversion_events': snapshot['conversion_events'],
+        'audiences': snapshot['audiences'],
+        'data_retention': snapshot.get('data_retention'),
+        # Targets have their own streams/URLs; only the measurement settings carry over
+        'enhanced_measurement': streams[0]['enhanced_measurement'] if streams else None,
+    }
+
+
+def desired_from_defaults() -> Dict:
+    """Desired state from the CUSTOM_DIMENSIONS / CONVERSION_EVENTS in ga4_admin"""
+    return {
+        'custom_dimensions': CUSTOM_DIMENSIONS,
+        'conversion_events': CONVERSION_EVENTS,
+        'audiences': [],
+        'data_retention': None,
+        'enhanced_measurement': None,
+    }
+
+
+def plan_changes(desired: Dict, current: Dict) -> List[Dict]:
+    """Changes needed to bring `current` (see read_property_state) up to `desired`"""
+    changes = []
+
+    for dim in desired['custom_dimensions']:
+        if dim['parameter_name'] not in current['custom_dimensions']:
+            changes.append({'action': 'create_custom_dimension', 'key': dim['parameter_name'], 'resource': dim})
+
+    for event_name in desired['conversion_events']:
+        if event_name not in current['conversion_events']:
+            changes.append({'action': 'create_conversion_event', 'key': event_name, 'resource': event_name})
+
+    for audience in desired['audiences']:
+        if audience['display_name'] not in current['audiences']:
+            changes.append({'action': 'create_audience', 'key': audience['display_name'], 'resource': audience})
+
+    retention = desired.get('data_retention')
+    if retention and any(retention[f] != current['data_retention'][f] for f in RETENTION_FIELDS):
+        changes.append({'action': 'update_data_retention', 'key': 'dataRetentionSettings', 'resource': retention})
+
+    enhanced = desired.get('enhanced_measurement')
+    if enhanced:
+        for stream in current['web_streams']:
+            if stream['enhanced_measurement'] != enhanced:
+                changes.append({
+                    'action': 'update_enhanced_measurement',
+                    'key': stream['name'],
+                    'resource': enhanced,
+                })
+
+    return changes
+
+
+def apply_change(automation: GA4SetupAutomation, change: Dict):
+    """Execute one planned change through the shared call policy"""
+    from google.analytics.admin_v1alpha import (
+        Audience,
+        ConversionEvent,
+        CustomDimension,
+        DataRetentionSettings,
+        EnhancedMeasurementSettings,
+    )
+    from google.protobuf import field_mask_pb2
+
+    path = automation.property_path
+    action, resource = change['action'], change['resource']
+
+    if action == 'create_custom_dimension':
+        automation.call('create_custom_dimension', parent=path, custom_dimension=CustomDimension(
+            parameter_name=resource['parameter_name'],
+            display_name=resource['display_name'],
+            description=resource.get('description', ''),
+            scope=resource['scope'],
+            disallow_ads_personalization=resource.get('disallow_ads_personalization', False),
+        ))
+    elif action == 'create_conversion_event':
+        automation.call('create_conversion_event', parent=path,
+                        conversion_event=ConversionEvent(event_name=resource))
+    elif action == 'create_audience':
+        automation.call('create_audience', parent=path, audience=Audience(resource))
+    elif action == 'update_data_retention':
+        automation.call(
+            'update_data_retention_settings',
+            data_retention_settings=DataRetentionSettings(name=f"{path}/dataRetentionSettings", **resource),
+            update_mask=field_mask_pb2.FieldMask(paths=list(resource)),
+        )
+    elif action == 'update_enhanced_measurement':
+        automation.call(
+            'update_enhanced_measurement_settings',
+            enhanced_measurement_settings=EnhancedMeasurementSettings(
+                name=f"{change['key']}/enhancedMeasurementSettings", **resource),
+            update_mask=field_mask_pb2.FieldMask(paths=list(resource)),
+        )
+    elif action == 'archive_custom_dimension':
+        automation.call('archive_custom_dimension', name=resource)
+    elif action == 'archive_audience':
+        automation.call('archive_audience', request={'name': resource})
+    else:
+        raise ValueError(f"Unknown action: {action}")
+
+
+def apply_changes(automation: GA4SetupAutomation, changes: List[Dict],
+                  guard: Optional[Callable[[], None]] = None) -> Dict:
+    """
+    Apply changes one by one; a failed change doesn't stop the rest.
+
+    `guard` is called before each change, and whatever it raises aborts
+    the remaining changes.
+    """
+    result = {'applied': 0, 'failed': 0, 'errors': []}
+    for change in changes:
+        if guard:
+            guard()
+        try:
+            apply_change(automation, change)
+            result['applied'] += 1
+        except Exception as e:
+            result['failed'] += 1
+            result['errors'].append(f"{change['action']} {change['key']}: {e}")
+    return result
+
+
+def keep_from_config(config: Dict) -> Dict[str, Set[str]]:
+    """What prune keeps by default: CUSTOM_DIMENSIONS plus ga4-config.json's dimensions and audiences"""
+    return {
+        'custom_dimensions': (
+            {dim['parameter_name'] for dim in CUSTOM_DIMENSIONS}
+            | {dim['name'] for dim in config.get('customDimensions', [])}
+        ),
+        'audiences': {audience['name'] for audience in config.get('audiences', [])},
+    }
+
+
+def keep_from_desired(desired: Dict) -> Dict[str, Set[str]]:
+    """What prune keeps when a template defines the fleet"""
+    return {
+        'custom_dimensions': {dim['parameter_name'] for dim in desired['custom_dimensions']},
+        'audiences': {audience['display_name'] for audience in desired['audiences']},
+    }
+
+
+def plan_prune(keep: Dict[str, Set[str]], automation: GA4SetupAutomation) -> Dict:
+    """Archive changes for one property's custom dimensions and audiences not in `keep`"""
+    changes = []
+    with span('read_state'):
+        # Exported CustomDimensionRecords leave out the resource name, which archiving needs
+        dims = automation.list_records(
+            'list_custom_dimensions', 'custom_dimensions', lambda dim: (dim.parameter_name, dim.name))
+        for parameter_name, name in dims:
+            if parameter_name not in keep['custom_dimensions']:
+                changes.append({'action': 'archive_custom_dimension', 'key': parameter_name, 'resource': name})
+        for audience in automation.iter_audiences():
+            if audience.display_name not in keep['audiences'] | PROTECTED_AUDIENCES:
+                changes.append({'action': 'archive_audience', 'key': audience.display_name, 'resource': audience.name})
+    return {'planned': len(changes), 'changes': changes}
+
+
+def apply_planned(automation: GA4SetupAutomation, plan: Dict) -> Dict:
+    """Apply a plan computed earlier (e.g. shown for confirmation) without re-reading"""
+    result = dict(plan)
+    with span('apply', changes=plan['planned']):
+        result.update(apply_changes(automation, plan['changes']))
+    return result
+
+
+def normalize_roles(roles: List[str]) -> List[str]:
+    """'viewer' -> 'predefinedRoles/viewer'; full role names pass through"""
+    return sorted(role if '/' in role else f"{ROLE_PREFIX}{role}" for role in roles)
+
+
+def read_access_bindings(automation: GA4SetupAutomation, parent: str) -> Dict[str, AccessBindingRecord]:
+    """Existing direct user bindings on an account or property, keyed by lowercased email"""
+    return {binding.user: binding for binding in automation.iter_access_bindings(parent)}
+
+
+def plan_access(desired: Dict[str, Optional[List[str]]], current: Dict[str, Dict]) -> List[Dict]:
+    """
+    Binding changes for one parent.
+
+    `desired` maps email to its exact role list, or to None to revoke the
+    user's access. Users already bound with the same roles are skipped.
+    """
+    changes = []
+    for user, roles in desired.items():
+        existing = current.get(user.lower())
+        if roles is None:
+            if existing:
+                changes.append({'action': 'delete_access_binding', 'key': user, 'resource': existing.name})
+        elif not existing:
+            changes.append({'action': 'create_access_binding', 'key': user, 'resource': roles})
+        elif existing.roles != roles:
+            changes.append({
+                'action': 'update_access_binding',
+                'key': user,
+                'resource': {'name': existing.name, 'roles': roles},
+            })
+    return changes
+
+
+def apply_access(automation: GA4SetupAutomation, parent: str, changes: List[Dict]) -> Dict:
+    """
+    Apply binding changes with one batch call per kind (chunked at the API limit).
+
+    Each batch is atomic, so a failed batch counts all of its changes as failed.
+    """
+    from google.analytics.admin_v1alpha import (
+        AccessBinding,
+        BatchCreateAccessBindingsRequest,
+        BatchDeleteAccessBindingsRequest,
+        BatchUpdateAccessBindingsRequest,
+        CreateAccessBindingRequest,
+        DeleteAccessBindingRequest,
+        UpdateAccessBindingRequest,
+    )
+
+    def create(change):
+        return CreateAccessBindingRequest(
+            parent=parent, access_binding=AccessBinding(user=change['key'], roles=change['resource']))
+
+    def update(change):
+        return UpdateAccessBindingRequest(access_binding=AccessBinding(**change['resource']))
+
+    def delete(change):
+        return DeleteAccessBindingRequest(name=change['resource'])
+
+    batches = (
+        ('create_access_binding', 'batch_create_access_bindings', BatchCreateAccessBindingsRequest, create),
+        ('update_access_binding', 'batch_update_access_bindings', BatchUpdateAccessBindingsRequest, update),
+        ('delete_access_binding', 'batch_delete_access_bindings', BatchDeleteAccessBindingsRequest, delete),
+    )
+
+    result = {'applied': 0, 'failed': 0, 'errors': []}
+    for action, method, batch_request, build in batches:
+        pending = [change for change in changes if change['action'] == action]
+        for start in range(0, len(pending), MAX_ACCESS_BINDINGS_PER_BATCH):
+            chunk = pending[start:start + MAX_ACCESS_BINDINGS_PER_BATCH]
+            try:
+                automation.call(method, request=batch_request(
+                    parent=parent, requests=[build(change) for change in chunk]))
+                result['applied'] += len(chunk)
+            except Exception as e:
+                result['failed'] += len(chunk)
+                result['errors'].append(f"{method} ({len(chunk)} bindings): {e}")
+    return result
+
+
+def provision_access(automation: GA4SetupAutomation, parent: str,
+                     desired: Dict[str, Optional[List[str]]], dry_run: bool = False) -> Dict:
+    """Diff one parent's bindings against `desired` and apply the difference"""
+    with span('read_bindings'):
+        current = read_access_bindings(automation, parent)
+    changes = plan_access(desired, current)
+    result = {'planned': len(changes), 'changes': changes}
+    if changes and not dry_run:
+        with span('apply', changes=len(changes)):
+            result.update(apply_access(automation, parent, changes))
+    return result
+
+
+def traced(task: Callable, target: str) -> Callable:
+    """task wrapped in a 'property' span, parented to the caller's span across threads"""
+    context = contextvars.copy_context()
+
+    def run_traced(*args):
+        with span('property', target=target):
+            return task(*args)
+
+    return lambda *args: context.copy().run(run_traced, *args)
+
+
+def run_fleet(property_ids: List[str], task: Callable[[str], Dict],
+              max_workers: int = DEFAULT_WORKERS) -> Dict[str, Dict]:
+    """Run task(property_id) concurrently; per-property failures are captured, not raised"""
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(traced(task, property_id), property_id): property_id
+            for property_id in property_ids
+        }
+        for future in as_completed(futures):
+            property_id = futures[future]
+            try:
+                results[property_id] = future.result()
+            except Exception as e:
+                results[property_id] = {'error': str(e)}
+            print_result(property_id, results[property_id])
+    return results
+
+
+def plan_and_apply(automation: GA4SetupAutomation, desired: Dict, dry_run: bool = False,
+                   state: Optional[FleetState] = None, force: bool = False,
+                   guard: Optional[Callable[[], None]] = None) -> Dict:
+    """
+    Read one property's config, plan against `desired` and apply unless dry_run.
+
+    With a FleetState, a property last applied from the same desired state
+    and unchanged since is skipped after one change-history call; successful
+    applies are recorded for the next run. `guard` is called before each
+    write and aborts the property by raising (see run_worker).
+    """
+    entry = state.get(automation.property_id) if state is not None else None
+    desired_fingerprint = fingerprint(desired)
+    if not force and entry:
+        with span('fingerprint_check'):
+            if is_unchanged(automation, entry, desired_fingerprint):
+                return {'planned': 0, 'changes': [], 'skipped': True}
+
+    started = datetime.now(timezone.utc)
+    with span('read_state'):
+        current = read_property_state(automation, desired)
+    changes = plan_changes(desired, current)
+    result = {'planned': len(changes), 'changes': changes}
+    if changes and not dry_run:
+        with span('apply', changes=len(changes)):
+            result.update(apply_changes(automation, changes, guard))
+
+    if state is not None and not dry_run:
+        if result.get('failed'):
+            state.forget(automation.property_id)
+        else:
+            with span('record_state'):
+                account = entry['account'] if entry else automation.call(
+                    'get_property', name=automation.property_path).parent
+                state.record(automation.property_id, desired_fingerprint, account,
+                             current_cursor(automation, account, started))
+    return result
+
+
+def run_worker(queue, automation: Callable[[str], GA4SetupAutomation], max_workers: int = DEFAULT_WORKERS,
+               lease_seconds: float = DEFAULT_LEASE_SECONDS, state: Optional[FleetState] = None,
+               force: bool = False) -> Dict[str, Dict]:
+    """
+    Claim and run jobs from `queue` with max_workers threads until it is drained.
+
+    Each job is one property, run with the queue's spec through
+    plan_and_apply. Leases are renewed in the background; a job whose lease
+    is lost is abandoned before its next write and left to its new owner. Idle
+    threads keep polling while other workers hold leases, so jobs abandoned
+    by a crashed worker are picked up once their lease expires.
+    """
+    spec = queue.spec()
+    if spec is None:
+        raise ValueError(f"queue {queue.name!r} has no submitted run")
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    keeper = LeaseKeeper(queue, lease_seconds)
+    stop = threading.Event()
+    results = {}
+    results_lock = threading.Lock()
+
+    def work():
+        while not stop.is_set():
+            lease = queue.claim(owner, lease_seconds)
+            if lease is None:
+                counts = queue.counts()
+                if not (counts.get('pending') or counts.get('leased') or counts.get('expired')):
+                    return
+                stop.wait(QUEUE_POLL_SECONDS)
+                continue
+            if stop.is_set():
+                # Claimed just as the worker was stopping; give it straight back
+                queue.release(lease)
+                return
+
+            keeper.add(lease)
+            try:
+                result = traced(plan_and_apply, lease.job_id)(
+                    automation(lease.job_id), spec['desired'], spec['dry_run'], state, force,
+                    lambda: keeper.check(lease))
+            except LeaseLost as e:
+                print(f"  ⚠️  {lease.job_id}: {e}, leaving it to its new owner")
+                continue
+            except Exception as e:
+                result = {'error': str(e)}
+            finally:
+                keeper.remove(lease)
+
+            if queue.complete(lease, result):
+                with results_lock:
+                    results[lease.job_id] = result
+                print_result(lease.job_id, result)
+            else:
+                print(f"  ⚠️  {lease.job_id}: lease expired before the result was recorded")
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = [executor.submit(contextvars.copy_context().run, work) for _ in range(max_workers)]
+    try:
+        for future in futures:
+            future.result()
+    except KeyboardInterrupt:
+        print("\n⏹️  Stopping: finishing the jobs in progress, claiming no new ones (Ctrl-C again to release them)")
+        stop.set()
+        raise
+    finally:
+        try:
+            # Leases stay renewed until the jobs in progress are done
+            executor.shutdown(wait=True)
+        except KeyboardInterrupt:
+            # A second Ctrl-C: other workers can pick the jobs up now rather than after their leases expire
+            print(f"\n⏹️  Released {keeper.release_all()} unfinished jobs back to the queue")
+            raise
+        finally:
+            keeper.close()
+    return results
+
+
+def print_result(property_id: str, result: Dict):
+    if 'error' in result:
+        print(f"  ❌ {property_id}: {result['error']}")
+        return
+    if result.get('skipped'):
+        print(f"  ⏭️  {property_id}: unchanged since last apply")
+        return
+    if not result.get('planned'):
+        print(f"  ⏭️  {property_id}: up to date")
+        return
+    if 'applied' not in result:
+        print(f"  📝 {property_id}: {result['planned']} changes planned")
+        for change in result['changes']:
+            sign = '-' if change['action'].startswith(('archive_', 'delete_')) else '+'
+            print(f"      {sign} {change['action']} {change['key']}")
+        return
+    status = '✅' if not result['failed'] else '⚠️ '
+    print(f"  {status} {property_id}: {result['applied']} applied, {result['failed']} failed")
+    for error in result['errors']:
+        print(f"      {error}")
+
+
+def parse_property_ids(value: Optional[str], path: Optional[str] = None) -> List[str]:
+    """Property IDs from a comma-separated list and/or a file (one per line, # comments)"""
+    ids = [p.strip() for p in (value or '').split(',') if p.strip()]
+    if path:
+        with open(path) as f:
+            ids.extend(line.split('#')[0].strip() for line in f if line.split('#')[0].strip())
+    return list(dict.fromkeys(ids))
+
+
+def summarize(results: Dict[str, Dict]) -> bool:
+    """Print totals and return True when every property succeeded"""
+    failed = [pid for pid, r in results.items() if 'error' in r or r.get('failed')]
+    changed = sum(1 for r in results.values() if r.get('planned'))
+    skipped = sum(1 for r in results.values() if r.get('skipped'))
+    print(f"\n✨ {len(results)} properties: {changed} with changes, {skipped} skipped unchanged, "
+          f"{len(failed)} with failures")
+    return not failed
+
+
+def automation_factory(args, manage_users: bool = False) -> Callable[..., GA4SetupAutomation]:
+    """
+    automation(property_id, parent=None) for the command line's credentials:
+    a cassette replay, a tenant pool or one shared client and rate limiter.
+    """
+    scopes = USER_MANAGEMENT_SCOPES if manage_users else SCOPES
+    if args.replay:
+        # Every call is served from the cassette; no credentials needed
+        replay = ReplayClient(args.replay, args.replay_speed)
+        limiter = RateLimiter(args.qps)
+        print(f"📼 Replaying {args.replay} at {args.replay_speed:g}x")
+
+        def automation(property_id: str, parent: Optional[str] = None) -> GA4SetupAutomation:
+            return GA4SetupAutomation(property_id, client=replay, limiter=limiter)
+    elif args.tenants:
+        # One client and rate limiter per tenant, created when first needed
+        pool = CredentialPool.from_file(args.tenants, scopes, args.qps)
+
+        def automation(property_id: str, parent: Optional[str] = None) -> GA4SetupAutomation:
+            return pool.automation(property_id, parent)
+    else:
+        # One client and one rate limiter for the whole run, created when first needed
+        # (queue submissions of `apply` never talk to the Admin API)
+        clients = []
+        client_lock = threading.Lock()
+        limiter = RateLimiter(args.qps)
+
+        def automation(property_id: str, parent: Optional[str] = None) -> GA4SetupAutomation:
+            with client_lock:
+                if not clients:
+                    clients.append(build_admin_client(load_credentials(
+                        args.auth, args.service_account, manage_users=manage_users)))
+            return GA4SetupAutomation(property_id, client=clients[0], limiter=limiter)
+
+    if args.record:
+        writer = CassetteWriter(args.record)
+        build_automation = automation
+
+        def automation(property_id: str, parent: Optional[str] = None) -> GA4SetupAutomation:
+            recording = build_automation(property_id, parent)
+            recording.client = RecordingClient(recording.client, writer)
+            return recording
+
+    return automation
+
+
+def open_state(args) -> Optional[FleetState]:
+    """
+    The fleet state for --state, or None under --replay: replays plan every
+    property without reading or writing the real state file, and without the
+    change-history calls the cassette may not have recorded.
+    """
+    if args.replay:
+        return None
+    return FleetState(get_state_path(args.state))
+
+
+def run(args):
+    if args.command == 'queue-status':
+        queue = open_queue(args.queue, args.queue_name)
+        counts = queue.counts()
+        print(f"📊 Queue {args.queue_name}: " + (', '.join(f"{n} {s}" for s, n in sorted(counts.items())) or 'empty'))
+        for job_id, result in sorted(queue.results().items()):
+            if 'error' in result or result.get('failed'):
+                print_result(job_id, result)
+        return
+
+    automation = automation_factory(args, manage_users=args.command == 'access')
+
+    if args.command == 'export':
+        if args.property_id:
+            output = json.dumps(read_property_config(automation(args.property_id)), indent=2) + '\n'
+            if args.output:
+                with open(args.output, 'w') as f:
+                    f.write(output)
+                print(f"✅ Exported {args.property_id} to {args.output}")
+            else:
+                print(output, end='')
+            return
+
+        property_ids = parse_property_ids(args.properties, args.properties_file)
+        if not property_ids:
+            print("❌ export needs --property-id, --properties or --properties-file")
+            sys.exit(1)
+        output = open(args.output, 'w') if args.output else sys.stdout
+        failed = 0
+        try:
+            for snapshot in iter_exports(property_ids, automation, args.workers):
+                failed += 'error' in snapshot
+                output.write(json.dumps(snapshot) + '\n')
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        log = sys.stderr if output is sys.stdout else sys.stdout
+        print(f"✅ Exported {len(property_ids) - failed} properties ({failed} failed)", file=log)
+        sys.exit(0 if not failed else 1)
+
+    if args.command == 'worker':
+        queue = open_queue(args.queue, args.queue_name)
+        print(f"\n👷 Working on queue {args.queue_name} ({args.workers} at a time)\n")
+        state = open_state(args)
+        try:
+            results = run_worker(queue, automation, args.workers, args.lease, state, args.force)
+        finally:
+            if state is not None:
+                state.save()
+        sys.exit(0 if summarize(results) else 1)
+
+    if args.command == 'prune':
+        property_ids = parse_property_ids(args.properties, args.properties_file)
+        if not property_ids:
+            print("❌ prune needs --properties or --properties-file")
+            sys.exit(1)
+        if args.from_file or args.source:
+            if args.from_file:
+                with open(args.from_file) as f:
+                    snapshot = json.load(f)
+            else:
+                print(f"\n📥 Reading template property {args.source}...")
+                snapshot = read_property_config(automation(args.source))
+            keep = keep_from_desired(desired_from_snapshot(snapshot))
+            property_ids = [p for p in property_ids if p != args.source]
+        else:
+            keep = keep_from_config(load_tracking_config(Path(args.config)))
+
+        print(f"\n🧹 Looking for stale custom dimensions and audiences on {len(property_ids)} properties\n")
+        plans = run_fleet(property_ids, lambda property_id: plan_prune(keep, automation(property_id)), args.workers)
+        planned = {pid: plan for pid, plan in plans.items() if plan.get('planned')}
+        total = sum(plan['planned'] for plan in planned.values())
+        if args.dry_run or not total:
+            sys.exit(0 if summarize(plans) else 1)
+
+        if not args.yes:
+            try:
+                answer = input(f"\n⚠️  Archive {total} resources on {len(planned)} properties? "
+                               f"Archived resources can't be restored. [y/N] ")
+            except EOFError:
+                answer = ''
+            if answer.strip().lower() not in ('y', 'yes'):
+                print("Nothing archived")
+                sys.exit(1)
+
+        print(f"\n🗑️  Archiving on {len(planned)} properties ({args.workers} at a time)\n")
+        results = run_fleet(
+            list(planned), lambda property_id: apply_planned(automation(property_id), planned[property_id]),
+            args.workers)
+        # Properties that couldn't be read count as failures of this run too
+        results.update({pid: plan for pid, plan in plans.items() if 'error' in plan})
+        sys.exit(0 if summarize(results) else 1)
+
+    if args.command == 'clone':
+        targets = parse_property_ids(args.targets, args.targets_file)
+        if not targets or not (args.source or args.from_file):
+            print("❌ clone needs --source (or --from-file) and --targets (or --targets-file)")
+            sys.exit(1)
+        if args.from_file:
+            with open(args.from_file) as f:
+                snapshot = json.load(f)
+        else:
+            print(f"\n📥 Reading template property {args.source}...")
+            snapshot = read_property_config(automation(args.source))
+        desired = desired_from_snapshot(snapshot)
+        targets = [t for t in targets if t != args.source]
+        if not args.queue:
+            print(f"🚀 Cloning to {len(targets)} properties ({args.workers} at a time)\n")
+    elif args.command == 'access':
+        parents = [f"properties/{p}" for p in parse_property_ids(args.properties, args.properties_file)]
+        parents += [f"accounts/{a}" for a in parse_property_ids(args.accounts)]
+        if not parents:
+            print("❌ access needs --properties, --properties-file or --accounts")
+            sys.exit(1)
+        roles = None if args.revoke else normalize_roles(parse_property_ids(args.roles))
+        desired_access = {user: roles for user in parse_property_ids(args.users)}
+        verb = 'Revoking' if args.revoke else 'Granting'
+        print(f"\n🔑 {verb} access for {len(desired_access)} users on {len(parents)} properties/accounts\n")
+        results = run_fleet(
+            parents,
+            lambda parent: provision_access(
+                automation(parent.split('/')[1], parent), parent, desired_access, args.dry_run),
+            args.workers,
+        )
+        sys.exit(0 if summarize(results) else 1)
+    else:
+        targets = parse_property_ids(args.properties, args.properties_file)
+        if not targets:
+            print("❌ apply needs --properties or --properties-file")
+            sys.exit(1)
+        desired = desired_from_defaults()
+        if not args.queue:
+            print(f"\n🚀 Applying configuration to {len(targets)} properties ({args.workers} at a time)\n")
+
+    if args.queue:
+        queue = open_queue(args.queue, args.queue_name)
+        queue.submit({'command': args.command, 'desired': desired, 'dry_run': args.dry_run}, targets)
+        print(f"📬 Queued {len(targets)} properties on {args.queue_name}; start workers with: "
+              f"ga4_fleet.py worker --queue={args.queue}")
+        return
+
+    state = open_state(args)
+    try:
+        results = run_fleet(
+            targets,
+            lambda property_id: plan_and_apply(
+                automation(property_id), desired, args.dry_run, state, args.force),
+            args.workers,
+        )
+    finally:
+        if state is not None:
+            state.save()
+    sys.exit(0 if summarize(results) else 1)
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export, clone and apply GA4 configuration across properties')
+    parser.add_argument('--auth', action='store_true', help='Use OAuth2 authentication')
+    parser.add_argument('--service-account', help='Path to service account JSON file')
+    parser.add_argument('--tenants', help='JSON file mapping properties/accounts to credentials (multi-tenant runs)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Properties processed concurrently')
+    parser.add_argument('--qps', type=float, default=DEFAULT_QPS, help='Admin API calls per second (all workers)')
+    parser.add_argument('--trace', help='Append trace spans to this JSONL file (see ga4_trace.py summary)')
+    add_cassette_arguments(parser)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help="Write properties' configuration as JSON")
+    export_parser.add_argument('--property-id', help='GA4 Property ID (written as one JSON document)')
+    export_parser.add_argument('--properties', help='Comma-separated property IDs (written as JSONL)')
+    export_parser.add_argument('--properties-file', help='File with one property ID per line (written as JSONL)')
+    export_parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+
+    clone_parser = commands.add_parser('clone', help='Replicate a template property to target properties')
+    clone_parser.add_argument('--source', help='Template property ID')
+    clone_parser.add_argument('--from-file', help='Use an exported template JSON instead of reading --source')
+    clone_parser.add_argument('--targets', help='Comma-separated target property IDs')
+    clone_parser.add_argument('--targets-file', help='File with one target property ID per line')
+    clone_parser.add_argument('--dry-run', action='store_true', help='Show the plan without writing')
+    clone_parser.add_argument('--force', action='store_true',
+                              help='Re-check properties even if unchanged since last apply')
+    clone_parser.add_argument('--state',
+                              help=f'Fleet state file (default: GA4_FLEET_STATE or ./{DEFAULT_STATE_FILE})')
+
+    apply_parser = commands.add_parser('apply', help='Apply CUSTOM_DIMENSIONS / CONVERSION_EVENTS to properties')
+    apply_parser.add_argument('--properties', help='Comma-separated property IDs')
+    apply_parser.add_argument('--properties-file', help='File with one property ID per line')
+    apply_parser.add_argument('--dry-run', action='store_true', help='Show the plan without writing')
+    apply_parser.add_argument('--force', action='store_true',
+                              help='Re-check properties even if unchanged since last apply')
+    apply_parser.add_argument('--state',
+                              help=f'Fleet state file (default: GA4_FLEET_STATE or ./{DEFAULT_STATE_FILE})')
+
+    access_parser = commands.add_parser('access', help='Grant or revoke user access across properties or accounts')
+    access_parser.add_argument('--users', required=True, help='Comma-separated user emails')
+    access_parser.add_argument('--roles', default='viewer',
+                               help='Comma-separated roles: viewer, analyst, editor, admin, no-cost-data, no-revenue-data')
+    access_parser.add_argument('--revoke', action='store_true', help='Remove the users instead of granting --roles')
+    access_parser.add_argument('--properties', help='Comma-separated property IDs')
+    access_parser.add_argument('--properties-file', help='File with one property ID per line')
+    access_parser.add_argument('--accounts', help='Comma-separated account IDs (bindings apply to every property in them)')
+    access_parser.add_argument('--dry-run', action='store_true', help='Show the plan without writing')
+
+    prune_parser = commands.add_parser('prune', help='Archive custom dimensions and audiences that are no longer wanted')
+    prune_parser.add_argument('--properties', help='Comma-separated property IDs')
+    prune_parser.add_argument('--properties-file', help='File with one property ID per line')
+    prune_parser.add_argument('--source', help='Keep only what this template property has')
+    prune_parser.add_argument('--from-file', help='Keep only what this exported template has')
+    prune_parser.add_argument('--config', default=str(DEFAULT_CONFIG_PATH),
+                              help='ga4-config.json whose dimensions and audiences are kept (without a template)')
+    prune_parser.add_argument('--dry-run', action='store_true', help='Show what would be archived and stop')
+    prune_parser.add_argument('--yes', action='store_true', help='Archive without asking for confirmation')
+
+    worker_parser = commands.add_parser('worker', help='Claim and run queued clone/apply jobs')
+    worker_parser.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS,
+                               help='Seconds a claim lasts without renewal')
+    worker_parser.add_argument('--force', action='store_true',
+                               help='Re-check properties even if unchanged since last apply')
+    worker_parser.add_argument('--state',
+                               help=f'Fleet state file (default: GA4_FLEET_STATE or ./{DEFAULT_STATE_FILE})')
+
+    status_parser = commands.add_parser('queue-status', help="Show a queue's job counts and failures")
+
+    for queue_parser in (clone_parser, apply_parser, worker_parser, status_parser):
+        queue_parser.add_argument('--queue', required=queue_parser in (worker_parser, status_parser),
+                                  help='Shared queue: sqlite:///path.db or redis://host:6379/0')
+        queue_parser.add_argument('--queue-name', default=DEFAULT_QUEUE_NAME,
+                                  help='Queue name, to keep separate runs apart on one backend')
+
+    args = parser.parse_args()
+
+    if args.trace:
+        configure_tracing(args.trace)
+    with span('fleet.run', command=args.command):
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
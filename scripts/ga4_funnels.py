@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+GA4 Funnel & Path Analysis - vectorized analysis of adventure-game events
+
+Loads exported events (GA4 BigQuery export JSONL, Measurement Protocol style
+JSONL, or CSV) into NumPy arrays and computes:
+
+- multi-step funnels, using the funnel definitions in ga4-config.json
+- scene → next_scene transition matrices and per-scene drop-off
+- conversion rates per budget tier
+
+String columns are dictionary-encoded once with np.unique, and every
+analysis after loading works on integer code arrays. None of them loops
+over rows in Python, so millions of events are analysed in seconds.
+
+Usage:
+   python ga4_funnels.py events.jsonl [--config=ga4-setup/ga4-config.json]
+"""
+
+import argparse
+import csv
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+DEFAULT_CONFIG_PATH = Path(__file__).parent / 'ga4-setup' / 'ga4-config.json'
+
+# Event parameters loaded by default; funnel conditions may add more
+DEFAULT_PARAMS = ['scene', 'choice', 'next_scene', 'budget', 'page_path']
+
+CONVERSION_EVENT = 'conversion_savvycal_booking_click'
+
+NOT_SET = '(not set)'
+
+USER_FIELDS = ('user_pseudo_id', 'client_id', 'user_id')
+TIMESTAMP_FIELDS = ('event_timestamp', 'timestamp_micros', 'timestamp')
+EVENT_FIELDS = ('event_name', 'name')
+
+
+class Column:
+    """Dictionary-encoded string column: codes index into a sorted vocabulary"""
+
+    __slots__ = ('codes', 'vocab')
+
+    def __init__(self, values):
+        self.vocab, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        self.codes = codes.astype(np.int32)
+
+    def code(self, value: str) -> int:
+        """Code for a value, or -1 if it never occurs"""
+        index = int(np.searchsorted(self.vocab, value))
+        if index < len(self.vocab) and self.vocab[index] == value:
+            return index
+        return -1
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class EventTable:
+    """Events sorted by (user, timestamp) with dictionary-encoded columns"""
+
+    def __init__(self, users, timestamps, events, params: Dict[str, Iterable[str]]):
+        user_column = Column(users)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+
+        # Sort once; funnels and paths rely on per-user chronological order
+        order = np.lexsort((timestamps, user_column.codes))
+        self.users = user_column.codes[order]
+        self.user_vocab = user_column.vocab
+        self.timestamps = timestamps[order]
+        self.events = Column(np.asarray(events, dtype=str)[order])
+        self.params = {
+            name: Column(np.asarray(values, dtype=str)[order])
+            for name, values in params.items()
+        }
+
+    def __len__(self):
+        return len(self.users)
+
+    @property
+    def n_users(self) -> int:
+        return len(self.user_vocab)
+
+    def match(self, event: str, condition: Optional[Dict[str, str]] = None) -> np.ndarray:
+        """Boolean mask of events named `event` whose params equal `condition`"""
+        mask = self.events.codes == self.events.code(event)
+        for name, value in (condition or {}).items():
+            column = self.params[name]
+            mask &= column.codes == column.code(str(value))
+        return mask
+
+
+def _event_field(event: Dict, names) -> str:
+    for name in names:
+        if name in event:
+            return event[name]
+    return ''
+
+
+def _event_params(event: Dict) -> Dict:
+    """Flatten BigQuery export params, MP-style params or top-level fields"""
+    if 'event_params' in event:
+        params = {}
+        for param in event['event_params']:
+            value = param.get('value', {})
+            params[param['key']] = next(
+                (v for v in value.values() if v is not None), '')
+        return params
+    if 'params' in event:
+        return event['params']
+    return event
+
+
+def _parse_timestamps(values: List) -> np.ndarray:
+    try:
+        return np.asarray(values, dtype=np.int64)
+    except ValueError:
+        # ISO-8601 strings; GA4 exports use microseconds, so match that
+        return np.asarray(values, dtype='datetime64[us]').astype(np.int64)
+
+
+def load_events(path: str, params: Optional[List[str]] = None) -> EventTable:
+    """Load a JSONL or CSV event export into an EventTable"""
+    params = list(dict.fromkeys((params or []) + DEFAULT_PARAMS))
+    users, timestamps, events = [], [], []
+    columns = {name: [] for name in params}
+
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            records = list(csv.DictReader(f))
+        users = [_event_field(r, USER_FIELDS) for r in records]
+        timestamps = [_event_field(r, TIMESTAMP_FIELDS) for r in records]
+        events = [_event_field(r, EVENT_FIELDS) for r in records]
+        for name in params:
+            columns[name] = [r.get(name) or '' for r in records]
+    else:
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                event_params = _event_params(event)
+                users.append(_event_field(event, USER_FIELDS))
+                timestamps.append(_event_field(event, TIMESTAMP_FIELDS))
+                events.append(_event_field(event, EVENT_FIELDS))
+                for name in params:
+                    value = event_params.get(name)
+                    columns[name].append('' if value is None else str(value))
+
+    return EventTable(users, _parse_timestamps(timestamps), events, columns)
+
+
+def funnel(table: EventTable, steps: List[Dict]) -> List[Dict]:
+    """
+    Closed, ordered funnel: users who hit each step after the previous one.
+
+    Steps use the ga4-config.json format: {'name', 'event', 'condition'}.
+    Because events are sorted by (user, timestamp), the first match per
+    user is found with np.unique(..., return_index=True).
+    """
+    reached_at = np.full(table.n_users, np.iinfo(np.int64).min, dtype=np.int64)
+    active = np.ones(table.n_users, dtype=bool)
+    results = []
+
+    for step in steps:
+        mask = table.match(step['event'], step.get('condition'))
+        mask &= active[table.users]
+        mask &= table.timestamps >= reached_at[table.users]
+
+        step_users, first_rows = np.unique(table.users[mask], return_index=True)
+        step_times = table.timestamps[mask][first_rows]
+
+        active[:] = False
+        active[step_users] = True
+        reached_at[step_users] = step_times
+
+        users = len(step_users)
+        previous = results[-1]['users'] if results else users
+        first = results[0]['users'] if results else users
+        results.append({
+            'name': step.get('name', step['event']),
+            'users': users,
+            'step_rate': users / previous if previous else 0.0,
+            'overall_rate': users / first if first else 0.0,
+        })
+    return results
+
+
+def transition_matrix(from_values, to_values, weights=None):
+    """
+    Count transitions between two string columns.
+
+    Returns (labels, matrix) where matrix[i, j] is the (weighted) number of
+    transitions from labels[i] to labels[j]. Works for raw events (weights
+    None) and aggregated report rows (weights = eventCount).
+    """
+    from_values = np.asarray(from_values, dtype=str)
+    labels, codes = np.unique(
+        np.concatenate([from_values, np.asarray(to_values, dtype=str)]), return_inverse=True)
+    n = len(labels)
+    from_codes, to_codes = codes[:len(from_values)], codes[len(from_values):]
+    counts = np.bincount(from_codes * n + to_codes, weights=weights, minlength=n * n)
+    return labels, counts.reshape(n, n)
+
+
+def scene_transitions(table: EventTable, event: str = 'adventure_choice'):
+    """Scene → next_scene matrix from the adventure_choice event parameters"""
+    mask = table.match(event)
+    scene, next_scene = table.params['scene'], table.params['next_scene']
+    return transition_matrix(
+        scene.vocab[scene.codes[mask]],
+        next_scene.vocab[next_scene.codes[mask]],
+    )
+
+
+def scene_dropoff(table: EventTable, event: str = 'adventure_choice') -> Dict[str, Dict]:
+    """Per scene: players who reached it and players whose last choice was there"""
+    mask = table.match(event)
+    users = table.users[mask]
+    scenes = table.params['scene'].codes[mask]
+    n_scenes = len(table.params['scene'].vocab)
+
+    # Unique (user, scene) pairs count players per scene, not visits
+    pairs = np.unique(users.astype(np.int64) * n_scenes + scenes)
+    reached = np.bincount(pairs % n_scenes, minlength=n_scenes)
+
+    # Events are sorted by user/time, so the last row per user is their exit scene
+    last = np.r_[users[1:] != users[:-1], True] if len(users) else np.array([], dtype=bool)
+    exits = np.bincount(scenes[last], minlength=n_scenes)
+
+    return {
+        str(label): {
+            'players': int(reached[i]),
+            'exits': int(exits[i]),
+            'exit_rate': float(exits[i] / reached[i]) if reached[i] else 0.0,
+        }
+        for i, label in enumerate(table.params['scene'].vocab)
+        if reached[i]
+    }
+
+
+def conversion_by_budget(table: EventTable, conversion_event: str = CONVERSION_EVENT) -> Dict[str, Dict]:
+    """
+    Conversion rate per budget tier.
+
+    A user's tier is the last non-empty budget value seen on any of their
+    events; users who never reported one are grouped as "(not set)".
+    """
+    budget = table.params['budget']
+    labels = np.append(budget.vocab, NOT_SET)
+    not_set = len(labels) - 1
+    empty = budget.code('')
+
+    tier = np.full(table.n_users, not_set, dtype=np.int64)
+    rows = np.flatnonzero(budget.codes != empty)
+    users = table.users[rows]
+    # Rows are sorted by user then time, so a user's last row is their latest tier
+    last = np.r_[users[1:] != users[:-1], True] if len(users) else np.array([], dtype=bool)
+    tier[users[last]] = budget.codes[rows[last]]
+
+    converted = np.zeros(table.n_users, dtype=bool)
+    converted[table.users[table.match(conversion_event)]] = True
+
+    users = np.bincount(tier, minlength=len(labels))
+    conversions = np.bincount(tier[converted], minlength=len(labels))
+    return {
+        str(labels[i]): {
+            'users': int(users[i]),
+            'conversions': int(conversions[i]),
+            'rate': float(conversions[i] / users[i]),
+        }
+        for i in range(len(labels))
+        if users[i] and i != empty
+    }
+
+
+def load_funnels(config_path: Path = DEFAULT_CONFIG_PATH) -> List[Dict]:
+    """Funnel definitions from ga4-config.json"""
+    with open(config_path) as f:
+        return json.load(f).get('funnels', [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Funnel and path analysis for exported GA4 events')
+    parser.add_argument('events', help='Event export (.jsonl or .csv)')
+    parser.add_argument('--config', default=str(DEFAULT_CONFIG_PATH), help='ga4-config.json with funnel definitions')
+    parser.add_argument('--top', type=int, default=10, help='Transitions to show')
+
+    args = parser.parse_args()
+
+    funnels = load_funnels(Path(args.config))
+    condition_params = [
+        name for f in funnels for step in f['steps'] for name in step.get('condition', {})
+    ]
+
+    try:
+        table = load_events(args.events, condition_params)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not load events: {e}")
+        sys.exit(1)
+
+    print(f"\n📊 Loaded {len(table)} events from {table.n_users} users")
+
+    for definition in funnels:
+        print(f"\n🔻 Funnel: {definition['name']}")
+        for step in funnel(table, definition['steps']):
+            print(f"  {step['name']:<24} {step['users']:>8}  "
+                  f"{step['step_rate']:6.1%} of previous  {step['overall_rate']:6.1%} overall")
+
+    labels, matrix = scene_transitions(table)
+    print("\n🔀 Top scene transitions")
+    flat = np.argsort(matrix, axis=None)[::-1][:args.top]
+    for index in flat:
+        i, j = divmod(int(index), len(labels))
+        if matrix[i, j]:
+            print(f"  {labels[i] or NOT_SET} → {labels[j] or NOT_SET}: {int(matrix[i, j])}")
+
+    print("\n🚪 Drop-off by scene")
+    for scene, stats in sorted(scene_dropoff(table).items(), key=lambda item: -item[1]['exit_rate']):
+        print(f"  {scene or NOT_SET:<24} {stats['players']:>8} players  {stats['exit_rate']:6.1%} exit here")
+
+    print("\n💰 Conversion by budget tier")
+    for tier, stats in conversion_by_budget(table).items():
+        print(f"  {tier:<24} {stats['conversions']:>8}/{stats['users']:<8} {stats['rate']:6.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+GA4 / GTM Config Generator - per-site GTM containers and ga4-config files
+
+Renders ga4-setup/gtm-container.json and ga4-setup/ga4-config.json for
+every site in a sites file (CSV or JSON), into <output>/<site>/. The
+hand-edited files are the templates:
+
+- `${name}` in any string value is replaced by the site's `name` variable
+- the values the files were written for (TEMPLATE_BINDINGS, e.g. the
+  measurement ID G-SVTZMGDLMF) are treated as variables too, so the
+  templates stay valid configs for the original site
+
+Each template is parsed once and compiled into a list of output chunks:
+long constant runs of pre-serialized JSON with the substitutions in
+between. Rendering a site streams those chunks, which produces the same
+bytes as json.dumps(..., indent=2) without building or copying the tree.
+A rendered file is compared chunk by chunk with the file on disk and only
+rewritten when it differs, so re-running over hundreds of sites only
+touches the ones whose variables or template changed. Sites are spread
+over a process pool.
+
+Sites file:
+   site,measurement_id,container_id,site_name
+   acme,G-ABC123XYZ,GTM-AB12CD,Acme Ltd
+
+Usage:
+   python ga4_gtm.py sites.csv [--output-dir=ga4-sites] [--workers=8]
+   python ga4_gtm.py sites.csv --check [--diff]
+"""
+
+import argparse
+import csv
+import difflib
+import json
+import os
+import re
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+TEMPLATE_DIR = Path(__file__).parent / 'ga4-setup'
+
+TEMPLATE_FILES = ('gtm-container.json', 'ga4-config.json')
+
+DEFAULT_OUTPUT_DIR = 'ga4-sites'
+
+# Literal values in the stock templates that act as variables
+TEMPLATE_BINDINGS = {
+    'measurement_id': 'G-SVTZMGDLMF',
+    'container_id': 'GTM-XXXXX',
+    'site_name': 'VibeCTO.ai',
+}
+
+# Variables a site may leave out; GTM assigns the container ID on import
+SITE_DEFAULTS = {'container_id': 'GTM-XXXXX'}
+
+VARIABLE_PATTERNS = {
+    'measurement_id': re.compile(r'G-[A-Z0-9]+'),
+    'container_id': re.compile(r'GTM-[A-Z0-9]+'),
+    # A directory name under --output-dir; never '.', '..' or hidden
+    'site': re.compile(r'\w[\w.-]*'),
+}
+
+# Sites handed to a worker process at a time
+SITES_PER_TASK = 16
+
+_PLACEHOLDER = re.compile(r'\$\{(\w+)\}')
+
+INDENT = '  '
+
+
+class Substitution:
+    """A template string value containing variables, as literal/variable segments"""
+
+    __slots__ = ('segments',)
+
+    def __init__(self, segments: List[Tuple[bool, str]]):
+        self.segments = segments
+
+    def render(self, variables: Dict[str, str]) -> str:
+        return ''.join(variables[text] if is_variable else text for is_variable, text in self.segments)
+
+
+def split_variables(value: str, bindings: Dict[str, str]) -> List[Tuple[bool, str]]:
+    """'${site_name} Container' -> [(True, 'site_name'), (False, ' Container')]"""
+    literals = {literal: name for name, literal in bindings.items()}
+    alternatives = [_PLACEHOLDER.pattern] + [re.escape(literal) for literal in sorted(literals, key=len, reverse=True)]
+    segments = []
+    position = 0
+    for match in re.finditer('|'.join(alternatives), value):
+        if match.start() > position:
+            segments.append((False, value[position:match.start()]))
+        segments.append((True, match.group(1) or literals[match.group(0)]))
+        position = match.end()
+    if position < len(value):
+        segments.append((False, value[position:]))
+    return segments
+
+
+def _compile(value, level: int, ops: List, bindings: Dict[str, str]):
+    # Mirrors json.dumps(indent=2, ensure_ascii=False) exactly
+    if isinstance(value, dict) and value:
+        for i, (key, item) in enumerate(value.items()):
+            ops.append(('{' if i == 0 else ',') + '\n' + INDENT * (level + 1)
+                       + json.dumps(key, ensure_ascii=False) + ': ')
+            _compile(item, level + 1, ops, bindings)
+        ops.append('\n' + INDENT * level + '}')
+    elif isinstance(value, list) and value:
+        for i, item in enumerate(value):
+            ops.append(('[' if i == 0 else ',') + '\n' + INDENT * (level + 1))
+            _compile(item, level + 1, ops, bindings)
+        ops.append('\n' + INDENT * level + ']')
+    elif isinstance(value, str):
+        segments = split_variables(value, bindings)
+        if any(is_variable for is_variable, _ in segments):
+            ops.append(Substitution(segments))
+        else:
+            ops.append(json.dumps(value, ensure_ascii=False))
+    else:
+        ops.append(json.dumps(value, ensure_ascii=False))
+
+
+class CompiledTemplate:
+    """A JSON template as constant byte chunks and Substitutions, in output order"""
+
+    def __init__(self, data, bindings: Dict[str, str] = TEMPLATE_BINDINGS):
+        ops = []
+        _compile(data, 0, ops, bindings)
+        ops.append('\n')
+
+        # Adjacent constants are merged, so most of a file is a few large chunks
+        self.chunks: List[Union[bytes, Substitution]] = []
+        pending = []
+        for op in ops:
+            if isinstance(op, str):
+                pending.append(op)
+                continue
+            if pending:
+                self.chunks.append(''.join(pending).encode())
+                pending = []
+            self.chunks.append(op)
+        if pending:
+            self.chunks.append(''.join(pending).encode())
+
+        self.variables = sorted({
+            text for chunk in self.chunks if isinstance(chunk, Substitution)
+            for is_variable, text in chunk.segments if is_variable
+        })
+
+    def render(self, variables: Dict[str, str]) -> Iterator[bytes]:
+        for chunk in self.chunks:
+            if isinstance(chunk, bytes):
+                yield chunk
+            else:
+                yield json.dumps(chunk.render(variables), ensure_ascii=False).encode()
+
+
+@lru_cache(maxsize=None)
+def _load_template(path: str, mtime_ns: int) -> CompiledTemplate:
+    with open(path) as f:
+        return CompiledTemplate(json.load(f))
+
+
+def load_template(path: Path) -> CompiledTemplate:
+    """Parsed and compiled once per process, and again only when the file changes"""
+    return _load_template(str(path), path.stat().st_mtime_ns)
+
+
+def load_sites(path: str) -> List[Dict[str, str]]:
+    """
+    Per-site variables from a CSV (one column per variable) or a JSON list of objects.
+
+    Raises ValueError on duplicate site names, which would render into the
+    same directory.
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.json'):
+            sites = json.load(f)
+        else:
+            sites = [{key: value.strip() for key, value in row.items() if key and value}
+                     for row in csv.DictReader(line for line in f if not line.startswith('#'))]
+    sites = [{key: str(value) for key, value in site.items()} for site in sites]
+    counts = Counter(site.get('site') for site in sites if site.get('site'))
+    duplicates = sorted(name for name, count in counts.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"duplicate sites in {path}: {', '.join(duplicates)}")
+    return sites
+
+
+def site_variables(site: Dict[str, str], required: List[str]) -> Dict[str, str]:
+    """The site's variables with defaults applied; raises ValueError if any are missing or malformed"""
+    variables = dict(SITE_DEFAULTS, **site)
+    missing = [name for name in ['site'] + required if not variables.get(name)]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    for name, pattern in VARIABLE_PATTERNS.items():
+        if name in variables and not pattern.fullmatch(variables[name]):
+            raise ValueError(f"invalid {name}: {variables[name]!r}")
+    return variables
+
+
+def matches_file(path: Path, chunks: Iterator[bytes]) -> bool:
+    """True if the file holds exactly these chunks; reads only as far as the first difference"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return False
+    with f:
+        for chunk in chunks:
+            if f.read(len(chunk)) != chunk:
+                return False
+        return f.read(1) == b''
+
+
+def write_chunks(path: Path, chunks: Iterator[bytes]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+
+
+def render_site(site: Dict[str, str], template_dir: str, output_dir: str, check: bool = False) -> Dict:
+    """Render every template for one site; returns {'site', 'files': {name: status}} or an error"""
+    templates = {name: load_template(Path(template_dir) / name) for name in TEMPLATE_FILES}
+    required = sorted({variable for template in templates.values() for variable in template.variables})
+    try:
+        variables = site_variables(site, required)
+    except ValueError as e:
+        return {'site': site.get('site', '?'), 'error': str(e)}
+
+    site_dir = Path(output_dir) / variables['site']
+    # Belt and braces next to VARIABLE_PATTERNS: output never leaves output_dir
+    if site_dir.resolve().parent != Path(output_dir).resolve():
+        return {'site': variables['site'], 'error': f"site directory {site_dir} is outside {output_dir}"}
+
+    files = {}
+    for name, template in templates.items():
+        path = site_dir / name
+        if matches_file(path, template.render(variables)):
+            files[name] = 'unchanged'
+            continue
+        files[name] = 'updated' if path.exists() else 'created'
+        if not check:
+            write_chunks(path, template.render(variables))
+    return {'site': variables['site'], 'files': files}
+
+
+def _render_batch(sites: List[Dict[str, str]], template_dir: str, output_dir: str, check: bool) -> List[Dict]:
+    return [render_site(site, template_dir, output_dir, check) for site in sites]
+
+
+def render_sites(sites: List[Dict[str, str]], template_dir: str = str(TEMPLATE_DIR),
+                 output_dir: str = DEFAULT_OUTPUT_DIR, check: bool = False,
+                 max_workers: Optional[int] = None) -> Iterator[Dict]:
+    """Results per site, in order; batches run in a process pool when there are enough sites"""
+    max_workers = max_workers or os.cpu_count() or 1
+    batches = [sites[i:i + SITES_PER_TASK] for i in range(0, len(sites), SITES_PER_TASK)]
+    if max_workers == 1 or len(batches) < 2:
+        # A pool costs more to start than a few dozen sites take to render
+        for batch in batches:
+            yield from _render_batch(batch, template_dir, output_dir, check)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_render_batch, batch, template_dir, output_dir, check) for batch in batches]
+        for future in futures:
+            yield from future.result()
+
+
+def print_diff(site: str, template_dir: str, output_dir: str, sites_by_name: Dict[str, Dict]):
+    for name in TEMPLATE_FILES:
+        template = load_template(Path(template_dir) / name)
+        variables = site_variables(sites_by_name[site], template.variables)
+        rendered = b''.join(template.render(variables)).decode().splitlines(keepends=True)
+        path = Path(output_dir) / site / name
+        existing = path.read_text().splitlines(keepends=True) if path.exists() else []
+        sys.stdout.writelines(difflib.unified_diff(existing, rendered, str(path), f"{path} (rendered)"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render per-site GTM containers and GA4 configs from templates')
+    parser.add_argument('sites', help='CSV or JSON file with one row/object of variables per site')
+    parser.add_argument('--templates', default=str(TEMPLATE_DIR),
+                        help=f"Directory with {' and '.join(TEMPLATE_FILES)}")
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help='Sites are written to OUTPUT_DIR/<site>/')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    parser.add_argument('--check', action='store_true', help="Report what would change without writing; exit 1 if anything would")
+    parser.add_argument('--diff', action='store_true', help='With --check, print a unified diff of every change')
+
+    args = parser.parse_args()
+
+    try:
+        sites = load_sites(args.sites)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+    changed_sites, failed = [], 0
+    for result in render_sites(sites, args.templates, args.output_dir, args.check, args.workers):
+        if 'error' in result:
+            failed += 1
+            print(f"  ❌ {result['site']}: {result['error']}")
+            continue
+        for status in result['files'].values():
+            counts[status] += 1
+        changes = [f"{name} {status}" for name, status in result['files'].items() if status != 'unchanged']
+        if changes:
+            changed_sites.append(result['site'])
+            print(f"  {'📝' if args.check else '✅'} {result['site']}: {', '.join(changes)}")
+
+    if args.check and args.diff:
+        sites_by_name = {site.get('site'): site for site in sites}
+        for site in changed_sites:
+            print_diff(site, args.templates, args.output_dir, sites_by_name)
+
+    created, updated = ('would be created', 'would be updated') if args.check else ('created', 'updated')
+    print(f"\n✨ {len(sites)} sites: {counts['created']} files {created}, {counts['updated']} {updated}, "
+          f"{counts['unchanged']} unchanged, {failed} sites failed")
+    sys.exit(1 if failed or (args.check and changed_sites) else 0)
+
+
+if __name__ == '__main__':
+    main()
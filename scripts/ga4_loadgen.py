@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+GA4 Tracking Load Generator - Measurement Protocol traffic at a fixed rate
+
+Builds realistic payloads for the custom events in ga4-config.json
+(conversion_savvycal_booking_click, form_submit, adventure_choice,
+adventure_navigation) and sends them over a pool of keep-alive HTTP
+connections at a configurable rate. Reports achieved events/sec and
+latency percentiles, plus any validation messages returned by the
+Measurement Protocol validation endpoint.
+
+Usage:
+   # Against the validation endpoint (nothing is recorded in GA4)
+   GA4_API_SECRET=... python ga4_loadgen.py --target=validate --rate=50 --duration=30
+
+   # Against a local stand-in collector, for pipeline throughput tests
+   python ga4_loadgen.py --target=local --rate=5000 --duration=10
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from ga4_mp import (
+    DEFAULT_CONFIG_PATH,
+    MAX_EVENTS_PER_REQUEST,
+    MP_COLLECT_URL,
+    MP_VALIDATE_URL,
+    ConnectionPool,
+    EventFactory,
+    collect_url,
+    get_api_secret,
+    load_event_definitions,
+    load_tracking_config,
+    start_collector,
+)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def generate_load(pool: ConnectionPool, factory: EventFactory, rate: float,
+                        duration: float, events_per_request: int = 1) -> Dict:
+    """
+    Send requests on a fixed schedule for `duration` seconds.
+
+    Requests are scheduled at rate / events_per_request per second. When
+    every pooled connection is busy, sends queue behind them, so the
+    achieved rate shows where the pipeline saturates. Latencies are
+    measured from the moment a send gets a connection, so they cover the
+    request itself and not the local queueing.
+    """
+    if rate <= 0:
+        raise ValueError(f"rate must be positive, got {rate:g}")
+    # Payloads hold at most MAX_EVENTS_PER_REQUEST events, so schedule by what is actually sent
+    events_per_request = max(1, min(events_per_request, MAX_EVENTS_PER_REQUEST))
+    interval = events_per_request / rate
+    latencies = []
+    results = {'requests': 0, 'events': 0, 'errors': 0, 'validation_messages': 0}
+    tasks = set()
+
+    async def send(payload: Dict):
+        body = json.dumps(payload).encode()
+        timing = {}
+        try:
+            status, response = await pool.request('POST', body, timing=timing)
+        except Exception as e:
+            results['errors'] += 1
+            results['last_error'] = f"{type(e).__name__}: {e}"
+            return
+        latencies.append(time.perf_counter() - timing['acquired'])
+        if status >= 300:
+            results['errors'] += 1
+            results['last_error'] = f"HTTP {status}: {response[:200].decode(errors='replace')}"
+            return
+        results['requests'] += 1
+        results['events'] += len(payload['events'])
+        if response:
+            try:
+                results['validation_messages'] += len(json.loads(response).get('validationMessages', []))
+            except ValueError:
+                pass
+
+    start = time.perf_counter()
+    sent = 0
+    while True:
+        now = time.perf_counter()
+        if now - start >= duration:
+            break
+        due = start + sent * interval
+        if due > now:
+            await asyncio.sleep(due - now)
+        # Cap queued sends so a saturated target doesn't grow memory without bound
+        if len(tasks) >= pool.size * 4:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        task = asyncio.ensure_future(send(factory.payload(events_per_request)))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        sent += 1
+
+    if tasks:
+        await asyncio.wait(tasks)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    results.update({
+        'elapsed': elapsed,
+        'events_per_sec': results['events'] / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+        'connections': pool.connections_opened,
+    })
+    return results
+
+
+async def run(args) -> Dict:
+    config_path = Path(args.config)
+    measurement_id = args.measurement_id or load_tracking_config(config_path)['measurementId']
+    factory = EventFactory(load_event_definitions(config_path), seed=args.seed)
+
+    collector = None
+    collector_stats = {}
+    if args.target == 'local':
+        collector = await start_collector(stats=collector_stats)
+        port = collector.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}/mp/collect"
+    else:
+        base_url = {'validate': MP_VALIDATE_URL, 'collect': MP_COLLECT_URL}.get(args.target, args.target)
+        api_secret = get_api_secret(args.api_secret)
+        if not api_secret:
+            raise ValueError("API secret required! Use --api-secret or set GA4_API_SECRET")
+        url = collect_url(base_url, measurement_id, api_secret)
+
+    pool = ConnectionPool(url, size=args.connections)
+    try:
+        results = await generate_load(pool, factory, args.rate, args.duration, args.events_per_request)
+    finally:
+        await pool.close()
+        if collector:
+            collector.close()
+            await collector.wait_closed()
+
+    if collector:
+        results['collector_events'] = collector_stats['events']
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measurement Protocol load generator for GA4 tracking')
+    parser.add_argument('--target', default='validate',
+                        help="'validate' (debug endpoint), 'collect', 'local' (stand-in collector) or a URL")
+    parser.add_argument('--measurement-id', help='Measurement ID (default: measurementId from ga4-config.json)')
+    parser.add_argument('--api-secret', help='Measurement Protocol API secret (can also use GA4_API_SECRET env var)')
+    parser.add_argument('--rate', type=float, default=100, help='Target events per second')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run')
+    parser.add_argument('--connections', type=int, default=10, help='Pooled keep-alive connections')
+    parser.add_argument('--events-per-request', type=int, default=1,
+                        help=f'Events batched per request (max {MAX_EVENTS_PER_REQUEST})')
+    parser.add_argument('--config', default=str(DEFAULT_CONFIG_PATH), help='Path to ga4-config.json')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible payloads')
+
+    args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error('--rate must be positive')
+
+    if args.target == 'collect':
+        print("⚠️  WARNING: Sending to the live collect endpoint records these events in GA4!")
+
+    print(f"\n🚀 Sending {args.rate:g} events/sec for {args.duration:g}s to {args.target}")
+    try:
+        results = asyncio.run(run(args))
+    except Exception as e:
+        print(f"\n❌ Load test failed: {e}")
+        sys.exit(1)
+
+    print(f"\n✅ {results['events']} events in {results['requests']} requests "
+          f"({results['events_per_sec']:.1f} events/sec over {results['elapsed']:.1f}s)")
+    print(f"   Latency p50 {results['p50_ms']:.1f}ms  p90 {results['p90_ms']:.1f}ms  "
+          f"p99 {results['p99_ms']:.1f}ms  max {results['max_ms']:.1f}ms")
+    print(f"   {results['connections']} connections opened")
+    if 'collector_events' in results:
+        print(f"   Collector received {results['collector_events']} events")
+    if results['errors']:
+        print(f"   ❌ {results['errors']} failed requests (last: {results['last_error']})")
+    if results['validation_messages']:
+        print(f"   ⚠️  {results['validation_messages']} validation messages")
+
+    sys.exit(0 if not results['errors'] and not results['validation_messages'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+GA4 Realtime Conversion Monitor - watch conversions arriving across a fleet
+
+Polls the Data API realtime report for many properties concurrently and
+alerts when a watched event stops arriving (or starts again). Each poll is
+one request per property: the watched events broken down by minutesAgo,
+covering the last 30 minutes. From that snapshot the monitor derives:
+
+- the events that arrived since the previous poll (the delta)
+- each event's state: 'arriving' (seen in the last RECENT_MINUTES),
+  'dropped' (silent recently although the rest of the window had traffic)
+  or 'quiet' (too little traffic to tell)
+
+The first poll of a property only records each event's state; after that
+only state changes are reported, so a healthy fleet is silent. Poll
+intervals adapt per property: they start at --min-interval, grow while
+every event keeps its state and reset on a state change or a surge of new
+events (the delta, which is otherwise only reported in alerts). They also
+stretch when the property's hourly realtime quota runs low.
+
+The upstream is any client with run_realtime_report(): the Data API, a
+recorded cassette (--replay, see ga4_cassette.py) or the simulated
+stand-in (--simulate) for trying the monitor locally.
+
+Usage:
+   python ga4_monitor.py --properties-file=sites.txt --auth
+   python ga4_monitor.py --property-id=123456789 --events=form_submit --min-interval=15
+   python ga4_monitor.py --properties=1,2,3 --simulate --simulate-drop=form_submit@90
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from ga4_cassette import CassetteWriter, RecordingClient, ReplayClient, add_cassette_arguments
+from ga4_fleet import parse_property_ids
+from ga4_mp import DEFAULT_CONFIG_PATH, load_tracking_config
+from ga4_reports import add_auth_arguments, load_credentials
+
+# Realtime reports cover the last 30 minutes on standard properties
+WINDOW_MINUTES = 30
+
+# An event seen within this many minutes counts as arriving
+RECENT_MINUTES = 5
+
+# Events in the rest of the window before recent silence counts as a drop
+MIN_BASELINE_EVENTS = 3
+
+# Seconds between polls of one property: the fastest, the slowest and the growth factor while unchanged
+MIN_INTERVAL = 30
+MAX_INTERVAL = 300
+INTERVAL_GROWTH = 1.5
+
+# New arrivals this many times the previous window's per-minute rate (and at
+# least MIN_BASELINE_EVENTS of them) reset the interval like a state change
+SURGE_FACTOR = 3.0
+
+# Data API allows 10 concurrent requests per project and property
+MAX_CONCURRENT_REQUESTS = 10
+
+# Below this many hourly realtime tokens left, a property is polled at MAX_INTERVAL
+LOW_QUOTA_TOKENS = 500
+
+
+def conversion_events(config: Dict) -> List[str]:
+    """Events ga4-config.json marks as conversions"""
+    return [event['name'] for event in config.get('customEvents', []) if event.get('markAsConversion')]
+
+
+def build_realtime_request(property_id: str, events: List[str]):
+    from google.analytics.data_v1beta.types import (
+        Dimension,
+        Filter,
+        FilterExpression,
+        Metric,
+        MinuteRange,
+        RunRealtimeReportRequest,
+    )
+
+    return RunRealtimeReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=[Dimension(name='eventName'), Dimension(name='minutesAgo')],
+        metrics=[Metric(name='eventCount')],
+        dimension_filter=FilterExpression(filter=Filter(
+            field_name='eventName', in_list_filter=Filter.InListFilter(values=events))),
+        minute_ranges=[MinuteRange(start_minutes_ago=WINDOW_MINUTES - 1, end_minutes_ago=0)],
+        return_property_quota=True,
+    )
+
+
+def parse_counts(response, events: List[str]) -> Dict[str, List[int]]:
+    """Per event, the event count for each minute ago (index 0 is the current minute)"""
+    counts = {event: [0] * WINDOW_MINUTES for event in events}
+    for row in response.rows:
+        event = row.dimension_values[0].value
+        minutes_ago = int(row.dimension_values[1].value)
+        if event in counts and minutes_ago < WINDOW_MINUTES:
+            counts[event][minutes_ago] += int(row.metric_values[0].value)
+    return counts
+
+
+def remaining_hourly_tokens(response) -> Optional[int]:
+    if 'property_quota' not in response:
+        return None
+    return response.property_quota.tokens_per_hour.remaining
+
+
+def classify(minutes: List[int]) -> str:
+    recent = sum(minutes[:RECENT_MINUTES])
+    if recent:
+        return 'arriving'
+    if sum(minutes[RECENT_MINUTES:]) >= MIN_BASELINE_EVENTS:
+        return 'dropped'
+    return 'quiet'
+
+
+def arrived_since(previous: List[int], current: List[int], elapsed_minutes: int) -> int:
+    """
+    Events counted in `current` but not in `previous`, taken elapsed_minutes earlier.
+
+    The previous snapshot's minutes shift by elapsed_minutes; whatever of it
+    is still inside the window is subtracted. Late events that GA4 adds to
+    minutes already seen are counted too.
+    """
+    still_in_window = sum(previous[:max(0, WINDOW_MINUTES - elapsed_minutes)])
+    return max(0, sum(current) - still_in_window)
+
+
+class PropertyWatch:
+    """Poll state of one property: last snapshot, event states and the next interval"""
+
+    def __init__(self, property_id: str, events: List[str],
+                 min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL):
+        self.property_id = property_id
+        self.events = events
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.snapshot = None
+        self.polled_at = None
+        self.states = {}
+
+    def update(self, counts: Dict[str, List[int]], now: float,
+               remaining_tokens: Optional[int] = None) -> List[Dict]:
+        """Take a new snapshot; returns alerts for events whose state changed since the last one"""
+        alerts = []
+        changed = False
+        for event in self.events:
+            minutes = counts[event]
+            state = classify(minutes)
+            delta = None
+            if self.snapshot is not None:
+                # minutesAgo buckets follow the clock, so count the minute boundaries crossed
+                elapsed = int(now // 60) - int(self.polled_at // 60)
+                delta = arrived_since(self.snapshot[event], minutes, elapsed)
+                # Steady traffic lets the interval grow; only a surge counts as a change
+                baseline_rate = sum(self.snapshot[event]) / WINDOW_MINUTES
+                if delta >= MIN_BASELINE_EVENTS and delta / max(1, elapsed) > SURGE_FACTOR * baseline_rate:
+                    changed = True
+            previous_state = self.states.get(event)
+            # The first poll sets the baseline silently
+            if event in self.states and state != previous_state:
+                changed = True
+                alerts.append(self._alert(event, state, previous_state, minutes, delta, now))
+            self.states[event] = state
+
+        self.snapshot = counts
+        self.polled_at = now
+        if remaining_tokens is not None and remaining_tokens < LOW_QUOTA_TOKENS:
+            self.interval = self.max_interval
+        elif changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * INTERVAL_GROWTH)
+        return alerts
+
+    def failed(self, error: Exception, now: float) -> List[Dict]:
+        """A failed poll backs off; only the first failure in a row is reported"""
+        self.interval = min(self.max_interval, self.interval * 2)
+        if self.states.get(None) == 'error':
+            return []
+        self.states[None] = 'error'
+        return [{'time': now, 'property': self.property_id, 'event': None, 'state': 'error', 'error': str(error)}]
+
+    def recovered(self):
+        self.states.pop(None, None)
+
+    def _alert(self, event: str, state: str, previous_state: Optional[str], minutes: List[int],
+               delta: Optional[int], now: float) -> Dict:
+        baseline = sum(minutes[RECENT_MINUTES:]) / (WINDOW_MINUTES - RECENT_MINUTES)
+        return {
+            'time': now,
+            'property': self.property_id,
+            'event': event,
+            'state': state,
+            'previous': previous_state,
+            'recent': sum(minutes[:RECENT_MINUTES]),
+            'baseline_per_minute': round(baseline, 2),
+            'delta': delta,
+        }
+
+
+def format_alert(alert: Dict) -> str:
+    clock = datetime.fromtimestamp(alert['time']).strftime('%H:%M:%S')
+    if alert['state'] == 'error':
+        return f"{clock} ❌ {alert['property']}: poll failed: {alert['error']}"
+    recent = f"{alert['recent']} in the last {RECENT_MINUTES} min"
+    if alert['state'] == 'dropped':
+        return (f"{clock} 🚨 {alert['property']} {alert['event']} stopped arriving: {recent}, "
+                f"was {alert['baseline_per_minute']}/min")
+    if alert['state'] == 'arriving':
+        again = ' again' if alert['previous'] else ''
+        return f"{clock} ✅ {alert['property']} {alert['event']} arriving{again}: {recent}"
+    return f"{clock} 💤 {alert['property']} {alert['event']} quiet: too little traffic to tell"
+
+
+class RealtimeMonitor:
+    """Polls every property on its own adaptive schedule, sharing a concurrency limit"""
+
+    def __init__(self, client, property_ids: List[str], events: List[str],
+                 min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL,
+                 max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+                 on_alert: Callable[[Dict], None] = lambda alert: print(format_alert(alert))):
+        self.client = client
+        self.events = events
+        self.min_interval = min_interval
+        self.max_concurrent = max_concurrent
+        self.on_alert = on_alert
+        self.watches = [PropertyWatch(pid, events, min_interval, max_interval) for pid in property_ids]
+        self.stats = {'requests': 0, 'errors': 0, 'alerts': 0}
+
+    async def _poll(self, watch: PropertyWatch, semaphore: asyncio.Semaphore) -> List[Dict]:
+        request = build_realtime_request(watch.property_id, self.events)
+        async with semaphore:
+            self.stats['requests'] += 1
+            try:
+                # The Data API client blocks; each poll runs on a worker thread
+                response = await asyncio.to_thread(self.client.run_realtime_report, request=request)
+            except Exception as e:
+                self.stats['errors'] += 1
+                return watch.failed(e, time.time())
+        watch.recovered()
+        return watch.update(parse_counts(response, self.events), time.time(), remaining_hourly_tokens(response))
+
+    async def _watch(self, watch: PropertyWatch, semaphore: asyncio.Semaphore, stop: asyncio.Event):
+        # Spread the first polls so a large fleet doesn't poll in lockstep
+        await asyncio.sleep(random.uniform(0, min(self.min_interval, len(self.watches) / self.max_concurrent)))
+        while not stop.is_set():
+            for alert in await self._poll(watch, semaphore):
+                self.stats['alerts'] += 1
+                self.on_alert(alert)
+            try:
+                await asyncio.wait_for(stop.wait(), watch.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, duration: Optional[float] = None):
+        """Watch until `duration` seconds have passed (or forever)"""
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(self._watch(watch, semaphore, stop)) for watch in self.watches]
+        try:
+            if duration is None:
+                await asyncio.gather(*tasks)
+            else:
+                await asyncio.sleep(duration)
+        finally:
+            stop.set()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class SimulatedRealtimeClient:
+    """
+    Local stand-in for the realtime report: Poisson event counts per minute.
+
+    `drops` maps an event to the seconds after start at which it stops
+    arriving, to try out drop-off alerts.
+    """
+
+    def __init__(self, rates: Dict[str, float], drops: Optional[Dict[str, float]] = None, seed: int = 0):
+        self.rates = rates
+        self.drops = drops or {}
+        self.seed = seed
+        self.started = time.time()
+        self.tokens_left = 5000
+        self._lock = threading.Lock()
+
+    def _count(self, property_id: str, event: str, minute: int) -> int:
+        if event in self.drops and minute * 60 >= self.started + self.drops[event]:
+            return 0
+        # Seeded per property, event and minute, so repeated polls agree on past minutes
+        rng = random.Random(f"{self.seed}:{property_id}:{event}:{minute}")
+        threshold, count, product = math.exp(-self.rates.get(event, 0.0)), 0, rng.random()
+        while product > threshold:
+            count += 1
+            product *= rng.random()
+        return count
+
+    def run_realtime_report(self, request, **kwargs):
+        from google.analytics.data_v1beta.types import (
+            DimensionValue,
+            MetricValue,
+            PropertyQuota,
+            QuotaStatus,
+            Row,
+            RunRealtimeReportResponse,
+        )
+
+        property_id = request.property.split('/')[1]
+        events = list(request.dimension_filter.filter.in_list_filter.values)
+        now_minute = int(time.time() // 60)
+        rows = []
+        for event in events:
+            for minutes_ago in range(WINDOW_MINUTES):
+                count = self._count(property_id, event, now_minute - minutes_ago)
+                if count:
+                    rows.append(Row(
+                        dimension_values=[DimensionValue(value=event), DimensionValue(value=f"{minutes_ago:02d}")],
+                        metric_values=[MetricValue(value=str(count))],
+                    ))
+        with self._lock:
+            self.tokens_left -= 1
+            remaining = self.tokens_left
+        return RunRealtimeReportResponse(
+            rows=rows,
+            row_count=len(rows),
+            property_quota=PropertyQuota(tokens_per_hour=QuotaStatus(consumed=1, remaining=remaining)),
+        )
+
+
+def parse_drops(values: List[str]) -> Dict[str, float]:
+    """['form_submit@90'] -> {'form_submit': 90.0}"""
+    drops = {}
+    for value in values:
+        event, _, seconds = value.partition('@')
+        drops[event] = float(seconds or 0)
+    return drops
+
+
+def build_client(args):
+    if args.simulate:
+        # About one booking click every few minutes, form submits a little more often
+        rates = {event: 0.5 if 'booking' in event else 1.0 for event in args.events}
+        return SimulatedRealtimeClient(rates, parse_drops(args.simulate_drop))
+    if args.replay:
+        return ReplayClient(args.replay, args.replay_speed)
+
+    from google.analytics.data_v1beta import BetaAnalyticsDataClient
+
+    credentials = load_credentials(args)
+    client = BetaAnalyticsDataClient(credentials=credentials) if credentials else BetaAnalyticsDataClient()
+    if args.record:
+        return RecordingClient(client, CassetteWriter(args.record))
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Watch GA4 conversions arrive in realtime across properties')
+    add_auth_arguments(parser)
+    parser.add_argument('--properties', help='Comma-separated property IDs')
+    parser.add_argument('--properties-file', help='File with one property ID per line')
+    parser.add_argument('--events', help='Comma-separated events to watch (default: conversions in ga4-config.json)')
+    parser.add_argument('--config', default=str(DEFAULT_CONFIG_PATH), help='Path to ga4-config.json')
+    parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL, help='Fastest poll interval (seconds)')
+    parser.add_argument('--max-interval', type=float, default=MAX_INTERVAL, help='Slowest poll interval (seconds)')
+    parser.add_argument('--max-concurrent', type=int, default=MAX_CONCURRENT_REQUESTS,
+                        help='Realtime requests in flight at once')
+    parser.add_argument('--duration', type=float, help='Stop after this many seconds (default: run until Ctrl-C)')
+    parser.add_argument('--alerts-file', help='Also append alerts to this JSONL file')
+    parser.add_argument('--simulate', action='store_true', help='Poll a local stand-in instead of the Data API')
+    parser.add_argument('--simulate-drop', action='append', default=[], metavar='EVENT@SECONDS',
+                        help='With --simulate, stop EVENT arriving after SECONDS')
+    add_cassette_arguments(parser)
+
+    args = parser.parse_args()
+
+    property_ids = parse_property_ids(args.properties or args.property_id or os.getenv('GA4_PROPERTY_ID'),
+                                      args.properties_file)
+    if not property_ids:
+        print("❌ Property IDs required! Use --property-id, --properties or --properties-file")
+        sys.exit(1)
+    args.events = args.events.split(',') if args.events else conversion_events(load_tracking_config(Path(args.config)))
+
+    alerts_file = open(args.alerts_file, 'a') if args.alerts_file else None
+
+    def on_alert(alert: Dict):
+        print(format_alert(alert), flush=True)
+        if alerts_file:
+            alerts_file.write(json.dumps(dict(
+                alert, time=datetime.fromtimestamp(alert['time'], timezone.utc).isoformat())) + '\n')
+            alerts_file.flush()
+
+    monitor = RealtimeMonitor(build_client(args), property_ids, args.events, args.min_interval,
+                              args.max_interval, args.max_concurrent, on_alert)
+    print(f"\n👀 Watching {', '.join(args.events)} on {len(property_ids)} properties "
+          f"(every {args.min_interval:g}–{args.max_interval:g}s)\n")
+    started = time.time()
+    try:
+        asyncio.run(monitor.run(args.duration))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if alerts_file:
+            alerts_file.close()
+    minutes = max(time.time() - started, 1) / 60
+    print(f"\n📊 {monitor.stats['requests']} requests ({monitor.stats['requests'] / minutes:.1f}/min), "
+          f"{monitor.stats['alerts']} alerts, {monitor.stats['errors']} failed polls")
+
+
+if __name__ == '__main__':
+    main()
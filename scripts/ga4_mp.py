@@ -0,0 +1,278 @@
+"""
+GA4 Measurement Protocol Module - payloads, pooled HTTP client and a local collector
+
+Shared by the load generator and the server-side relay. Everything here is
+stdlib asyncio, so no HTTP client library is needed:
+
+- load_event_definitions() reads the customEvents from ga4-config.json
+- EventFactory builds realistic payloads for those events
+- ConnectionPool sends HTTP/1.1 requests over a pool of keep-alive connections
+- start_collector() runs a stand-in /mp/collect endpoint for local testing
+"""
+import asyncio
+import json
+import os
+import random
+import ssl
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_CONFIG_PATH = Path(__file__).parent / 'ga4-setup' / 'ga4-config.json'
+
+MP_COLLECT_URL = 'https://www.google-analytics.com/mp/collect'
+MP_VALIDATE_URL = 'https://www.google-analytics.com/debug/mp/collect'
+
+# Measurement Protocol limit; all events in a request share one client_id
+MAX_EVENTS_PER_REQUEST = 25
+
+# Parameter names whose values are PII whatever they contain
+PII_PARAM_NAMES = frozenset({
+    'email', 'email_address', 'phone', 'phone_number',
+    'first_name', 'last_name', 'full_name', 'address',
+})
+
+# Plausible values for the parameters declared in ga4-config.json
+SAMPLE_PARAM_VALUES = {
+    'source': ['hero', 'navbar', 'footer', 'adventure', 'resources', 'contact'],
+    'destination': ['savvycal', 'ignition', 'launch-control', 'transformation'],
+    'budget': ['ready-high', 'ready-medium', 'ready-low', 'exploring'],
+    'form_name': ['contact', 'ignition_waitlist', 'launch_control_waitlist', 'community_waitlist'],
+    'scene': ['entry', 'qualification', 'ignition', 'launch-control', 'transformation', 'Final'],
+    'choice': ['build', 'scale', 'transform', 'explore', 'back'],
+    'next_scene': ['qualification', 'ignition', 'launch-control', 'transformation', 'Final'],
+    'navigation_type': ['back', 'restart', 'skip', 'home'],
+    'contact_method': ['email', 'phone', 'text'],
+    'has_company': ['true', 'false'],
+}
+
+
+def load_tracking_config(config_path: Path = DEFAULT_CONFIG_PATH) -> Dict:
+    """Load ga4-config.json"""
+    with open(config_path) as f:
+        return json.load(f)
+
+
+def load_event_definitions(config_path: Path = DEFAULT_CONFIG_PATH) -> Dict[str, Dict]:
+    """customEvents from ga4-config.json, keyed by event name"""
+    return {event['name']: event for event in load_tracking_config(config_path)['customEvents']}
+
+
+def collect_url(base_url: str, measurement_id: str, api_secret: str) -> str:
+    """Measurement Protocol URL with the measurement_id/api_secret query string"""
+    return f"{base_url}?{urlencode({'measurement_id': measurement_id, 'api_secret': api_secret})}"
+
+
+class EventFactory:
+    """Builds Measurement Protocol payloads for the configured custom events"""
+
+    def __init__(self, definitions: Dict[str, Dict], seed: Optional[int] = None):
+        self.definitions = definitions
+        self.names = list(definitions)
+        self.random = random.Random(seed)
+
+    def param_value(self, name: str) -> str:
+        if name == 'form_data':
+            return json.dumps({'form': self.random.choice(SAMPLE_PARAM_VALUES['form_name'])})
+        return self.random.choice(SAMPLE_PARAM_VALUES.get(name, ['test']))
+
+    def event(self, name: Optional[str] = None) -> Dict:
+        """One event with every parameter its definition declares, except PII ones"""
+        name = name or self.random.choice(self.names)
+        params = {param: self.param_value(param) for param in self.definitions[name]['parameters']
+                  if param not in PII_PARAM_NAMES}
+        params['engagement_time_msec'] = self.random.randrange(100, 30000)
+        params['event_id'] = uuid.uuid4().hex
+        return {'name': name, 'params': params}
+
+    def payload(self, events_per_request: int = 1, client_id: Optional[str] = None) -> Dict:
+        """A request body: one client and up to MAX_EVENTS_PER_REQUEST events"""
+        return {
+            'client_id': client_id or f"{self.random.randrange(10 ** 9)}.{int(time.time())}",
+            'timestamp_micros': int(time.time() * 1_000_000),
+            'events': [self.event() for _ in range(min(events_per_request, MAX_EVENTS_PER_REQUEST))],
+        }
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP/1.1 connection pool for a single origin.
+
+    At most `size` connections are open at once. Callers beyond that wait
+    for a free connection, which gives the natural backpressure the load
+    generator and relay rely on.
+    """
+
+    def __init__(self, url: str, size: int = 10, timeout: float = 30.0):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path += f"?{parts.query}"
+        self.size = size
+        self.timeout = timeout
+        self._ssl = ssl.create_default_context() if self.scheme == 'https' else None
+        self._idle: List[_Connection] = []
+        self._slots = asyncio.Semaphore(size)
+        self.connections_opened = 0
+
+    async def _connect(self) -> _Connection:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self._ssl), self.timeout)
+        self.connections_opened += 1
+        return _Connection(reader, writer)
+
+    async def _read_response(self, conn: _Connection) -> Tuple[int, bytes, bool]:
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by server')
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await conn.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int((await conn.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await conn.reader.readline()
+                    break
+                body += await conn.reader.readexactly(size)
+                await conn.reader.readline()
+        elif 'content-length' in headers:
+            body = await conn.reader.readexactly(int(headers['content-length']))
+        elif status in (204, 304):
+            body = b''
+        else:
+            body = await conn.reader.read()
+            headers['connection'] = 'close'
+
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        return status, body, keep_alive
+
+    async def request(self, method: str, body: bytes = b'', path: Optional[str] = None,
+                      content_type: str = 'application/json',
+                      timing: Optional[Dict] = None) -> Tuple[int, bytes]:
+        """
+        Send one request and return (status, body).
+
+        If `timing` is given, timing['acquired'] is set to the
+        time.perf_counter() at which a connection slot was obtained, so
+        callers can separate time spent queueing for the pool from the
+        request itself.
+        """
+        head = (
+            f"{method} {path or self.path} HTTP/1.1\r\n"
+            f"Host: {self.host}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode('latin-1')
+
+        async with self._slots:
+            if timing is not None:
+                timing['acquired'] = time.perf_counter()
+            # A pooled connection may have been closed by the server while idle;
+            # retry once on a fresh connection in that case
+            for attempt in range(2):
+                reused = bool(self._idle)
+                conn = self._idle.pop() if reused else await self._connect()
+                try:
+                    conn.writer.write(head + body)
+                    await conn.writer.drain()
+                    status, response, keep_alive = await asyncio.wait_for(
+                        self._read_response(conn), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    conn.close()
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except BaseException:
+                    conn.close()
+                    raise
+
+                if keep_alive:
+                    self._idle.append(conn)
+                else:
+                    conn.close()
+                return status, response
+
+    async def close(self):
+        for conn in self._idle:
+            conn.close()
+        for conn in self._idle:
+            try:
+                await conn.writer.wait_closed()
+            except ConnectionError:
+                pass
+        self._idle.clear()
+
+
+async def start_collector(host: str = '127.0.0.1', port: int = 0, stats: Optional[Dict] = None):
+    """
+    Stand-in /mp/collect endpoint for local load tests.
+
+    Accepts keep-alive POSTs, counts requests and events into `stats` and
+    answers like the validation endpoint. Returns the asyncio server; the
+    bound port is server.sockets[0].getsockname()[1].
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault('requests', 0)
+    stats.setdefault('events', 0)
+    response_body = json.dumps({'validationMessages': []}).encode()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    if key.strip().lower() == 'content-length':
+                        length = int(value)
+                body = await reader.readexactly(length) if length else b''
+                stats['requests'] += 1
+                try:
+                    stats['events'] += len(json.loads(body).get('events', []))
+                except ValueError:
+                    pass
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(response_body)).encode() + b"\r\n\r\n" + response_body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def get_api_secret(api_secret: Optional[str] = None) -> Optional[str]:
+    """Measurement Protocol API secret from the argument or GA4_API_SECRET"""
+    return api_secret or os.getenv('GA4_API_SECRET')
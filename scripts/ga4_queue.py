@@ -0,0 +1,405 @@
+"""
+GA4 Work Queue Module - leased, shared work queue for fleet runs
+
+A fleet run is submitted once: a spec (the command and desired state) plus
+one job per property. Any number of worker processes, on any number of
+hosts, then claim jobs from the shared queue:
+
+- claim() leases one job to a worker for `lease_seconds`, with a random
+  token
+- a worker renews its leases while it is working on them
+- complete() records the result, but only while the token still holds
+- a lease that expires (the worker crashed or hung) makes the job
+  claimable again; after MAX_ATTEMPTS claims it is marked failed instead
+
+A job is leased to at most one worker at a time. A worker whose lease was
+lost gets False from renew() and stops before its next write.
+
+Backends:
+   sqlite:///path/to/queue.db (or a plain path): one file, shared by
+       processes on a host or over a filesystem with working locks
+   redis://host:6379/0: Redis or any Redis-compatible server (requires
+       the redis package); claims are atomic Lua scripts
+"""
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_QUEUE_NAME = 'ga4-fleet'
+
+# Seconds a claim lasts without renewal
+DEFAULT_LEASE_SECONDS = 120
+
+# Claims (first run plus re-claims after expired leases) before a job is failed
+MAX_ATTEMPTS = 3
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and may now belong to another worker"""
+
+
+class Lease:
+    __slots__ = ('job_id', 'token', 'attempt')
+
+    def __init__(self, job_id: str, token: str, attempt: int):
+        self.job_id = job_id
+        self.token = token
+        self.attempt = attempt
+
+
+class SQLiteQueue:
+    """Queue in one SQLite file; every transition is a single write transaction"""
+
+    def __init__(self, path: str, name: str = DEFAULT_QUEUE_NAME):
+        self.path = path
+        self.name = name
+        self._local = threading.local()
+        with self._transaction() as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    queue TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    token TEXT,
+                    owner TEXT,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    PRIMARY KEY (queue, id)
+                )
+            ''')
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (queue, state, lease_until)')
+            db.execute('CREATE TABLE IF NOT EXISTS specs (queue TEXT PRIMARY KEY, spec TEXT NOT NULL)')
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self._connection()
+        # IMMEDIATE takes the write lock up front, so two claimers can't pick the same row
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def submit(self, spec: Dict, job_ids: List[str]):
+        """Store the run spec and (re)queue the given jobs as pending"""
+        with self._transaction() as db:
+            db.execute('INSERT OR REPLACE INTO specs VALUES (?, ?)', (self.name, json.dumps(spec)))
+            db.executemany(
+                'INSERT OR REPLACE INTO jobs (queue, id, state, attempts) VALUES (?, ?, ?, 0)',
+                [(self.name, job_id, 'pending') for job_id in job_ids],
+            )
+
+    def spec(self) -> Optional[Dict]:
+        row = self._connection().execute('SELECT spec FROM specs WHERE queue = ?', (self.name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def claim(self, owner: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[Lease]:
+        now = time.time()
+        with self._transaction() as db:
+            # Jobs abandoned too often are failed rather than handed out again
+            db.execute(
+                "UPDATE jobs SET state = 'failed', token = NULL, result = ? "
+                "WHERE queue = ? AND state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (json.dumps({'error': 'lease expired too many times'}), self.name, now, MAX_ATTEMPTS),
+            )
+            row = db.execute(
+                "SELECT id, attempts FROM jobs WHERE queue = ? "
+                "AND (state = 'pending' OR (state = 'leased' AND lease_until < ?)) LIMIT 1",
+                (self.name, now),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, attempts = row
+            token = secrets.token_hex(8)
+            db.execute(
+                "UPDATE jobs SET state = 'leased', token = ?, owner = ?, lease_until = ?, attempts = ? "
+                "WHERE queue = ? AND id = ?",
+                (token, owner, now + lease_seconds, attempts + 1, self.name, job_id),
+            )
+        return Lease(job_id, token, attempts + 1)
+
+    def renew(self, lease: Lease, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        """Extend a lease; False if it expired and was claimed by someone else"""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE queue = ? AND id = ? AND token = ? AND state = 'leased'",
+                (time.time() + lease_seconds, self.name, lease.job_id, lease.token),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, lease: Lease, result: Dict) -> bool:
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET state = 'done', token = NULL, result = ? "
+                "WHERE queue = ? AND id = ? AND token = ? AND state = 'leased'",
+                (json.dumps(result), self.name, lease.job_id, lease.token),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, lease: Lease):
+        """Give a job back unfinished (e.g. on shutdown) without using up an attempt"""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET state = 'pending', token = NULL, attempts = MAX(attempts - 1, 0) "
+                "WHERE queue = ? AND id = ? AND token = ? AND state = 'leased'",
+                (self.name, lease.job_id, lease.token),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        now = time.time()
+        rows = self._connection().execute(
+            "SELECT CASE WHEN state = 'leased' AND lease_until < ? THEN 'expired' ELSE state END, COUNT(*) "
+            "FROM jobs WHERE queue = ? GROUP BY 1",
+            (now, self.name),
+        ).fetchall()
+        return dict(rows)
+
+    def results(self) -> Dict[str, Dict]:
+        rows = self._connection().execute(
+            "SELECT id, result FROM jobs WHERE queue = ? AND result IS NOT NULL", (self.name,)).fetchall()
+        return {job_id: json.loads(result) for job_id, result in rows}
+
+
+# KEYS: pending list, leases zset, tokens hash, attempts hash, failed hash
+# ARGV: now, lease_until, token, max_attempts
+_REDIS_CLAIM = '''
+while true do
+    local job_id = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, 1)[1]
+    if job_id then
+        redis.call('ZREM', KEYS[2], job_id)
+    else
+        job_id = redis.call('LPOP', KEYS[1])
+    end
+    if not job_id then
+        return nil
+    end
+    local attempts = tonumber(redis.call('HGET', KEYS[4], job_id) or '0')
+    if attempts >= tonumber(ARGV[4]) then
+        redis.call('HDEL', KEYS[3], job_id)
+        redis.call('HSET', KEYS[5], job_id, '{"error": "lease expired too many times"}')
+    else
+        redis.call('HSET', KEYS[4], job_id, attempts + 1)
+        redis.call('HSET', KEYS[3], job_id, ARGV[3])
+        redis.call('ZADD', KEYS[2], ARGV[2], job_id)
+        return {job_id, attempts + 1}
+    end
+end
+'''
+
+# KEYS: leases zset, tokens hash; ARGV: job_id, token, lease_until
+_REDIS_RENEW = '''
+if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+return 1
+'''
+
+# KEYS: leases zset, tokens hash, results hash; ARGV: job_id, token, result
+_REDIS_COMPLETE = '''
+if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[3])
+return 1
+'''
+
+# KEYS: pending list, leases zset, tokens hash, attempts hash; ARGV: job_id, token
+_REDIS_RELEASE = '''
+if redis.call('HGET', KEYS[3], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('HINCRBY', KEYS[4], ARGV[1], -1)
+redis.call('RPUSH', KEYS[1], ARGV[1])
+return 1
+'''
+
+
+class RedisQueue:
+    """Queue in Redis (or a compatible server); claim/renew/complete are Lua scripts"""
+
+    def __init__(self, url: str, name: str = DEFAULT_QUEUE_NAME):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("Redis queues need the redis package: pip install redis")
+
+        self.name = name
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        prefix = f"{name}:"
+        self.keys = {key: prefix + key for key in (
+            'spec', 'pending', 'leases', 'tokens', 'attempts', 'results', 'failed')}
+        self._claim = self.redis.register_script(_REDIS_CLAIM)
+        self._renew = self.redis.register_script(_REDIS_RENEW)
+        self._complete = self.redis.register_script(_REDIS_COMPLETE)
+        self._release = self.redis.register_script(_REDIS_RELEASE)
+
+    def submit(self, spec: Dict, job_ids: List[str]):
+        k = self.keys
+        pipe = self.redis.pipeline()
+        pipe.set(k['spec'], json.dumps(spec))
+        if job_ids:
+            for job_id in job_ids:
+                pipe.lrem(k['pending'], 0, job_id)
+            pipe.zrem(k['leases'], *job_ids)
+            pipe.hdel(k['tokens'], *job_ids)
+            pipe.hdel(k['attempts'], *job_ids)
+            pipe.hdel(k['results'], *job_ids)
+            pipe.hdel(k['failed'], *job_ids)
+            pipe.rpush(k['pending'], *job_ids)
+        pipe.execute()
+
+    def spec(self) -> Optional[Dict]:
+        value = self.redis.get(self.keys['spec'])
+        return json.loads(value) if value else None
+
+    def claim(self, owner: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[Lease]:
+        k = self.keys
+        now = time.time()
+        token = f"{owner}:{secrets.token_hex(8)}"
+        claimed = self._claim(
+            keys=[k['pending'], k['leases'], k['tokens'], k['attempts'], k['failed']],
+            args=[now, now + lease_seconds, token, MAX_ATTEMPTS],
+        )
+        if not claimed:
+            return None
+        job_id, attempt = claimed
+        return Lease(job_id, token, int(attempt))
+
+    def renew(self, lease: Lease, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        k = self.keys
+        return bool(self._renew(
+            keys=[k['leases'], k['tokens']], args=[lease.job_id, lease.token, time.time() + lease_seconds]))
+
+    def complete(self, lease: Lease, result: Dict) -> bool:
+        k = self.keys
+        return bool(self._complete(
+            keys=[k['leases'], k['tokens'], k['results']], args=[lease.job_id, lease.token, json.dumps(result)]))
+
+    def release(self, lease: Lease):
+        k = self.keys
+        self._release(
+            keys=[k['pending'], k['leases'], k['tokens'], k['attempts']], args=[lease.job_id, lease.token])
+
+    def counts(self) -> Dict[str, int]:
+        k = self.keys
+        now = time.time()
+        counts = {
+            'pending': self.redis.llen(k['pending']),
+            'leased': self.redis.zcount(k['leases'], now, '+inf'),
+            'expired': self.redis.zcount(k['leases'], '-inf', now),
+            'done': self.redis.hlen(k['results']),
+            'failed': self.redis.hlen(k['failed']),
+        }
+        return {state: count for state, count in counts.items() if count}
+
+    def results(self) -> Dict[str, Dict]:
+        results = {**self.redis.hgetall(self.keys['failed']), **self.redis.hgetall(self.keys['results'])}
+        return {job_id: json.loads(result) for job_id, result in results.items()}
+
+
+def open_queue(url: str, name: str = DEFAULT_QUEUE_NAME):
+    """SQLiteQueue for sqlite:///path or a plain path, RedisQueue for redis:// URLs"""
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisQueue(url, name)
+    if url.startswith('sqlite:///'):
+        url = url[len('sqlite:///'):]
+    return SQLiteQueue(url, name)
+
+
+class LeaseKeeper:
+    """
+    Renews a worker's active leases in the background.
+
+    lost(lease) turns True once a renewal fails, or once renewals have
+    kept erroring for two thirds of the lease, so the worker can stop
+    before writing anything for a job someone else now owns (or soon may).
+    """
+
+    def __init__(self, queue, lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.queue = queue
+        self.lease_seconds = lease_seconds
+        self._active: Dict[str, Lease] = {}
+        self._lost = set()
+        self._renewed: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, lease: Lease):
+        with self._lock:
+            self._active[lease.token] = lease
+            self._renewed[lease.token] = time.monotonic()
+
+    def remove(self, lease: Lease):
+        with self._lock:
+            self._active.pop(lease.token, None)
+            self._lost.discard(lease.token)
+            self._renewed.pop(lease.token, None)
+
+    def lost(self, lease: Lease) -> bool:
+        with self._lock:
+            if lease.token in self._lost:
+                return True
+            renewed = self._renewed.get(lease.token)
+        return renewed is not None and time.monotonic() - renewed > self.lease_seconds * 2 / 3
+
+    def check(self, lease: Lease):
+        """Raise LeaseLost if the lease could not be renewed"""
+        if self.lost(lease):
+            raise LeaseLost(f"lease on {lease.job_id} was lost")
+
+    def release_all(self) -> int:
+        """
+        Hand every active lease back to the queue (e.g. on a forced shutdown).
+
+        The leases are marked lost first, so a job still running stops at
+        its next check() instead of writing for a job that is pending again.
+        """
+        with self._lock:
+            leases = list(self._active.values())
+            self._lost.update(lease.token for lease in leases)
+        for lease in leases:
+            self.queue.release(lease)
+        return len(leases)
+
+    def _run(self):
+        # Renew well before expiry, so one slow renewal doesn't cost the lease
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                leases = list(self._active.values())
+            for lease in leases:
+                try:
+                    renewed = self.queue.renew(lease, self.lease_seconds)
+                except Exception:
+                    continue
+                with self._lock:
+                    if not renewed:
+                        self._lost.add(lease.token)
+                    elif lease.token in self._active:
+                        self._renewed[lease.token] = time.monotonic()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
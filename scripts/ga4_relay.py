@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+GA4 Measurement Protocol Relay - batched server-side event forwarding
+
+Backend code hands events to the relay, either through the Python API
+(`await relay.submit(...)`) or by POSTing JSON to a small local HTTP
+endpoint. The relay:
+
+- checks each event against the customEvents in ga4-config.json and
+  strips PII values (see ga4_validate.py)
+- drops duplicates by event_id
+- coalesces events for the same client into Measurement Protocol requests
+  of up to 25 events
+- sends them over pooled keep-alive connections
+
+A bounded queue provides backpressure: when GA4 is slow, submit() waits
+and the HTTP endpoint holds the response, instead of buffering without
+limit.
+
+Usage:
+   GA4_API_SECRET=... python ga4_relay.py [--port=8787] [--target=collect]
+
+   curl -X POST localhost:8787/events -d '{"client_id": "123.456",
+        "events": [{"name": "form_submit", "params": {"form_name": "contact",
+        "event_id": "abc"}}]}'
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ga4_mp import (
+    DEFAULT_CONFIG_PATH,
+    MAX_EVENTS_PER_REQUEST,
+    MP_COLLECT_URL,
+    MP_VALIDATE_URL,
+    ConnectionPool,
+    collect_url,
+    get_api_secret,
+    load_tracking_config,
+    start_collector,
+)
+from ga4_validate import EVENT_VIOLATIONS, EventValidator, payload_shape_violations
+
+# Events waiting to be batched; submit() blocks once this many are queued
+MAX_QUEUED_EVENTS = 10000
+
+# How long a partial batch may wait for more events before it is sent
+FLUSH_INTERVAL = 0.25
+
+# Event IDs remembered for deduplication
+DEDUP_WINDOW = 100000
+
+# Attempts per Measurement Protocol request; network errors, 429 and 5xx are retried
+SEND_ATTEMPTS = 4
+
+# Seconds before the first retry, doubled after each failed attempt
+RETRY_BACKOFF = 0.5
+
+class DedupWindow:
+    """Bounded set of recently seen event IDs (oldest evicted first)"""
+
+    def __init__(self, size: int = DEDUP_WINDOW):
+        self.size = size
+        self._seen = OrderedDict()
+
+    def seen(self, event_id: str) -> bool:
+        """Record event_id and return True if it was already in the window"""
+        if event_id in self._seen:
+            self._seen.move_to_end(event_id)
+            return True
+        self._seen[event_id] = None
+        if len(self._seen) > self.size:
+            self._seen.popitem(last=False)
+        return False
+
+    def forget(self, event_id: str):
+        """Drop event_id, so a resubmitted event is accepted again"""
+        self._seen.pop(event_id, None)
+
+
+class Relay:
+    def __init__(self, pool: ConnectionPool, validator: EventValidator,
+                 max_queued: int = MAX_QUEUED_EVENTS,
+                 flush_interval: float = FLUSH_INTERVAL,
+                 max_batch: int = MAX_EVENTS_PER_REQUEST,
+                 dedup_window: int = DEDUP_WINDOW):
+        self.pool = pool
+        self.validator = validator
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.dedup = DedupWindow(dedup_window)
+        self.stats = {'accepted': 0, 'duplicates': 0, 'rejected': 0, 'pii_stripped': 0,
+                      'params_stripped': 0, 'sent': 0, 'requests': 0, 'failed': 0}
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._workers: List[asyncio.Task] = []
+        self._sending = set()
+
+    async def submit(self, client_id: str, events: List[Dict], user_id: Optional[str] = None,
+                     timestamp_micros: Optional[int] = None) -> Dict:
+        """
+        Validate, deduplicate and enqueue events for one client.
+
+        Waits while the queue is full. Returns per-call counts. Events are
+        cleaned like `ga4_validate.py --strip`: invalid events (unknown or
+        malformed) are counted and skipped rather than failing the whole
+        call, and offending parameters (PII, undeclared, too long) are
+        removed before the event is queued. Each
+        event keeps its own timestamp_micros (the call's, unless the event
+        has one), so coalescing never changes event times.
+        """
+        if not isinstance(events, list):
+            raise TypeError(f"events must be a list, not {type(events).__name__}")
+        result = {'accepted': 0, 'duplicates': 0, 'rejected': [], 'pii_stripped': 0, 'params_stripped': 0}
+        timestamp_micros = timestamp_micros or int(time.time() * 1_000_000)
+        for event in events:
+            cleaned, violations = self.validator.clean_event(event)
+            if cleaned is None:
+                self.stats['rejected'] += 1
+                name = event.get('name') if isinstance(event, dict) else None
+                result['rejected'].append(f"{name}: " + ', '.join(
+                    f"{code} {key or detail}" for code, key, detail in violations if code in EVENT_VIOLATIONS))
+                continue
+            event = cleaned
+            for code, _, _ in violations:
+                counter = 'pii_stripped' if code == 'pii' else 'params_stripped'
+                self.stats[counter] += 1
+                result[counter] += 1
+
+            event_id = event.get('params', {}).get('event_id')
+            if event_id and self.dedup.seen(event_id):
+                self.stats['duplicates'] += 1
+                result['duplicates'] += 1
+                continue
+
+            if 'timestamp_micros' not in event:
+                event = dict(event, timestamp_micros=timestamp_micros)
+            await self._queue.put((client_id, user_id, event))
+            self.stats['accepted'] += 1
+            result['accepted'] += 1
+        return result
+
+    async def _collect_batches(self) -> List[Dict]:
+        """
+        Drain the queue into per-client payloads.
+
+        Waits for the first event, then keeps taking events for up to
+        flush_interval or until a client's batch is full.
+        """
+        batches = OrderedDict()
+        item = await self._queue.get()
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            client_id, user_id, event = item
+            key = (client_id, user_id)
+            payload = batches.get(key)
+            if payload is None:
+                payload = {'client_id': client_id, 'events': []}
+                if user_id:
+                    payload['user_id'] = user_id
+                batches[key] = payload
+            payload['events'].append(event)
+            if len(payload['events']) >= self.max_batch:
+                break
+
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+        return list(batches.values())
+
+    async def _send(self, payload: Dict):
+        data = json.dumps(payload).encode()
+        for attempt in range(SEND_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                status, body = await self.pool.request('POST', data)
+            except Exception as e:
+                status, body = None, str(e).encode()
+            if status is not None and (status < 300 or (status < 500 and status != 429)):
+                break
+
+        if status is not None and status < 300:
+            self.stats['requests'] += 1
+            self.stats['sent'] += len(payload['events'])
+        else:
+            self.stats['failed'] += len(payload['events'])
+            print(f"  ❌ Relay request failed ({status}): {body[:200].decode(errors='replace')}")
+            # The events never reached GA4, so a client resubmitting them must not be deduplicated
+            for event in payload['events']:
+                event_id = event.get('params', {}).get('event_id')
+                if event_id:
+                    self.dedup.forget(event_id)
+        # Events only count as done once their request has finished, so flush() covers them
+        for _ in payload['events']:
+            self._queue.task_done()
+
+    async def _worker(self):
+        while True:
+            for payload in await self._collect_batches():
+                # The pool bounds concurrent requests; waiting here is the backpressure
+                while len(self._sending) >= self.pool.size:
+                    await asyncio.wait(self._sending, return_when=asyncio.FIRST_COMPLETED)
+                task = asyncio.ensure_future(self._send(payload))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+
+    def start(self):
+        self._workers.append(asyncio.ensure_future(self._worker()))
+
+    async def flush(self):
+        """Wait until everything submitted so far has been sent"""
+        await self._queue.join()
+
+    async def close(self):
+        await self.flush()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await self.pool.close()
+
+
+async def serve_http(relay: Relay, host: str = '127.0.0.1', port: int = 8787):
+    """Local endpoint: POST /events with an MP-style {client_id, events} body"""
+
+    async def respond(writer: asyncio.StreamWriter, status: str, payload: Dict):
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path = request_line.decode('latin-1').split()[:2]
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    if key.strip().lower() == 'content-length':
+                        length = int(value)
+                body = await reader.readexactly(length) if length else b''
+
+                if method == 'GET' and path == '/stats':
+                    await respond(writer, '200 OK', relay.stats)
+                    continue
+                if method != 'POST' or path != '/events':
+                    await respond(writer, '404 Not Found', {'error': 'POST /events'})
+                    continue
+                try:
+                    request = json.loads(body)
+                    shape = payload_shape_violations(request)
+                    if not shape and not isinstance(request.get('events'), list):
+                        shape = [('malformed', 'events', 'missing events list')]
+                    if not shape and not isinstance(request.get('client_id'), str):
+                        shape = [('malformed', 'client_id', 'client_id must be a string')]
+                    if not shape and not all(isinstance(event, dict) for event in request['events']):
+                        shape = [('malformed', 'events', 'every event must be an object')]
+                    if shape:
+                        raise ValueError('; '.join(detail for _, _, detail in shape))
+                    result = await relay.submit(
+                        request['client_id'], request['events'],
+                        user_id=request.get('user_id'),
+                        timestamp_micros=request.get('timestamp_micros'),
+                    )
+                except (ValueError, KeyError, TypeError) as e:
+                    await respond(writer, '400 Bad Request', {'error': str(e)})
+                    continue
+                await respond(writer, '202 Accepted', result)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def run(args):
+    config_path = Path(args.config)
+    validator = EventValidator.from_config(config_path)
+
+    if args.target == 'local':
+        collector = await start_collector()
+        url = f"http://127.0.0.1:{collector.sockets[0].getsockname()[1]}/mp/collect"
+    else:
+        measurement_id = args.measurement_id or load_tracking_config(config_path)['measurementId']
+        api_secret = get_api_secret(args.api_secret)
+        if not api_secret:
+            raise ValueError("API secret required! Use --api-secret or set GA4_API_SECRET")
+        base_url = {'validate': MP_VALIDATE_URL, 'collect': MP_COLLECT_URL}.get(args.target, args.target)
+        url = collect_url(base_url, measurement_id, api_secret)
+
+    relay = Relay(ConnectionPool(url, size=args.connections), validator)
+    relay.start()
+    server = await serve_http(relay, args.host, args.port)
+    print(f"✅ Relay listening on http://{args.host}:{args.port}/events → {args.target}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await relay.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batching Measurement Protocol relay for server-side events')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8787, help='Port to listen on')
+    parser.add_argument('--target', default='collect',
+                        help="'collect', 'validate', 'local' (stand-in collector) or a URL")
+    parser.add_argument('--measurement-id', help='Measurement ID (default: measurementId from ga4-config.json)')
+    parser.add_argument('--api-secret', help='Measurement Protocol API secret (can also use GA4_API_SECRET env var)')
+    parser.add_argument('--connections', type=int, default=4, help='Pooled keep-alive connections')
+    parser.add_argument('--config', default=str(DEFAULT_CONFIG_PATH), help='Path to ga4-config.json')
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n👋 Relay stopped")
+    except Exception as e:
+        print(f"\n❌ Relay failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+GA4 Report Runner - Data API reports with automatic sharding
+
+Reports broken down by high-cardinality dimensions (scene, choice,
+player_name) run into the Data API's row limits, "(other)" rows and
+sampling. The runner splits such queries into date-range shards (and,
+optionally, dimension-filter shards), fetches the shards concurrently at
+the API's concurrency limit, pages through each one with limit/offset and
+streams the rows into a single CSV or JSONL file.
+
+Responses are cached on disk (see ga4_cache.py), so repeated queries over
+closed date ranges don't hit the API again.
+
+Usage:
+   python ga4_reports.py --property-id=123456789 \\
+       --dimensions=customEvent:scene,customEvent:choice \\
+       --metrics=eventCount --start-date=90daysAgo --end-date=yesterday \\
+       --output=scenes.csv [--auth | --service-account=PATH]
+"""
+
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from ga4_cache import DEFAULT_MAX_BYTES, ReportCache, get_cache_path
+from ga4_cassette import CassetteWriter, RecordingClient, ReplayClient, add_cassette_arguments
+from ga4_config import authenticate_oauth, get_token_path
+
+# Configuration
+DATA_SCOPES = ['https://www.googleapis.com/auth/analytics.readonly']
+
+# Data API allows 10 concurrent requests per property (standard properties)
+MAX_CONCURRENT_REQUESTS = 10
+
+# Rows requested per page; the API caps a single response at 250,000 rows
+PAGE_SIZE = 100000
+
+# A shard reporting more rows than this is split further by date
+MAX_SHARD_ROWS = 500000
+
+# Pages buffered between fetch workers and the writer; bounds memory use
+MAX_BUFFERED_PAGES = 4
+
+# Dimensions that blow past row limits unless the query is sharded
+HIGH_CARDINALITY_DIMENSIONS = {
+    'customEvent:scene',
+    'customEvent:choice',
+    'customEvent:next_scene',
+    'customUser:player_name',
+}
+
+# Date range used for each shard when high-cardinality dimensions are present
+DEFAULT_SHARD_DAYS = 7
+
+_DONE = object()
+
+
+def resolve_date(value: str, today: Optional[date] = None) -> date:
+    """Resolve a Data API date string (YYYY-MM-DD, today, yesterday, NdaysAgo)"""
+    today = today or date.today()
+    if value == 'today':
+        return today
+    if value == 'yesterday':
+        return today - timedelta(days=1)
+    if value.endswith('daysAgo'):
+        return today - timedelta(days=int(value[:-len('daysAgo')]))
+    return date.fromisoformat(value)
+
+
+def split_date_range(start: date, end: date, days: int) -> List[Dict]:
+    """Split an inclusive date range into consecutive shards of at most `days` days"""
+    shards = []
+    current = start
+    while current <= end:
+        shard_end = min(current + timedelta(days=days - 1), end)
+        shards.append({'start_date': current, 'end_date': shard_end})
+        current = shard_end + timedelta(days=1)
+    return shards
+
+
+def plan_shards(query: Dict, shard_days: Optional[int] = None,
+                shard_filter: Optional[Dict] = None,
+                today: Optional[date] = None) -> List[Dict]:
+    """
+    Plan the initial shards for a report query.
+
+    Date-range shards are used when the query contains high-cardinality
+    dimensions (or `shard_days` is given). A `shard_filter` of the form
+    {'dimension': name, 'values': [...]} adds one disjoint in-list filter
+    shard per value group, crossed with the date shards.
+    """
+    start = resolve_date(query['start_date'], today)
+    end = resolve_date(query['end_date'], today)
+    if start > end:
+        raise ValueError(f"start_date {start} is after end_date {end}")
+
+    if shard_days is None and HIGH_CARDINALITY_DIMENSIONS.intersection(query['dimensions']):
+        shard_days = DEFAULT_SHARD_DAYS
+
+    if shard_days:
+        date_shards = split_date_range(start, end, shard_days)
+    else:
+        date_shards = [{'start_date': start, 'end_date': end}]
+
+    if not shard_filter:
+        return date_shards
+
+    return [
+        dict(date_shard, filter_dimension=shard_filter['dimension'], filter_values=values)
+        for date_shard in date_shards
+        for values in shard_filter['values']
+    ]
+
+
+def split_shard(shard: Dict) -> List[Dict]:
+    """Halve a shard's date range; single-day shards cannot be split further"""
+    start, end = shard['start_date'], shard['end_date']
+    if start >= end:
+        return []
+    middle = start + timedelta(days=(end - start).days // 2)
+    return [
+        dict(shard, start_date=start, end_date=middle),
+        dict(shard, start_date=middle + timedelta(days=1), end_date=end),
+    ]
+
+
+def report_headers(query: Dict) -> List[str]:
+    """Column names of the merged result, in the order rows are emitted"""
+    return list(query['dimensions']) + list(query['metrics'])
+
+
+def shard_query(query: Dict, shard_days: Optional[int] = None,
+                shard_filter: Optional[Dict] = None) -> Dict:
+    """
+    Return the query actually sent for sharded runs.
+
+    Rows from different date shards are only distinct if `date` is part of
+    the breakdown, so it is added when sharding by date. Without it, rows
+    for the same scene on different days would need re-aggregation, which
+    is wrong for non-additive metrics such as totalUsers. For the same
+    reason, shards of queries without `date` are never split by date.
+    """
+    sharded = shard_days or HIGH_CARDINALITY_DIMENSIONS.intersection(query['dimensions'])
+    if sharded and 'date' not in query['dimensions']:
+        return dict(query, dimensions=['date'] + list(query['dimensions']))
+    return query
+
+
+class ReportRunner:
+    def __init__(self, property_id: str, credentials=None, client=None,
+                 max_workers: int = MAX_CONCURRENT_REQUESTS,
+                 page_size: int = PAGE_SIZE,
+                 max_shard_rows: int = MAX_SHARD_ROWS,
+                 cache: Optional[ReportCache] = None):
+        self.property_id = property_id
+        self.property_path = f"properties/{property_id}"
+        self.max_workers = max_workers
+        self.page_size = page_size
+        self.max_shard_rows = max_shard_rows
+        self.cache = cache
+        self.stats = {'shards': 0, 'splits': 0, 'requests': 0, 'cache_hits': 0,
+                      'rows': 0, 'sampled_shards': 0}
+        self._stats_lock = threading.Lock()
+
+        if client:
+            self.client = client
+        else:
+            from google.analytics.data_v1beta import BetaAnalyticsDataClient
+
+            if credentials:
+                self.client = BetaAnalyticsDataClient(credentials=credentials)
+            else:
+                self.client = BetaAnalyticsDataClient()
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _build_request(self, query: Dict, shard: Dict, offset: int, limit: Optional[int] = None):
+        from google.analytics.data_v1beta.types import (
+            DateRange,
+            Dimension,
+            Filter,
+            FilterExpression,
+            Metric,
+            RunReportRequest,
+        )
+
+        request = RunReportRequest(
+            property=self.property_path,
+            dimensions=[Dimension(name=name) for name in query['dimensions']],
+            metrics=[Metric(name=name) for name in query['metrics']],
+            date_ranges=[DateRange(
+                start_date=shard['start_date'].isoformat(),
+                end_date=shard['end_date'].isoformat(),
+            )],
+            limit=limit or self.page_size,
+            offset=offset,
+        )
+        if shard.get('filter_dimension'):
+            request.dimension_filter = FilterExpression(filter=Filter(
+                field_name=shard['filter_dimension'],
+                in_list_filter=Filter.InListFilter(values=shard['filter_values']),
+            ))
+        return request
+
+    def _run_report(self, request):
+        if self.cache:
+            response = self.cache.get(request)
+            if response is not None:
+                self._count('cache_hits')
+                return response
+
+        response = self._fetch_report(request)
+        if self.cache:
+            self.cache.put(request, response)
+        return response
+
+    def _fetch_report(self, request):
+        from google.api_core import exceptions
+        from google.api_core.retry import Retry, if_exception_type
+
+        # Quota and transient errors back off instead of failing the whole pull
+        retry = Retry(
+            predicate=if_exception_type(
+                exceptions.ResourceExhausted,
+                exceptions.ServiceUnavailable,
+                exceptions.DeadlineExceeded,
+            ),
+            initial=1.0,
+            maximum=60.0,
+            multiplier=2.0,
+            timeout=600.0,
+        )
+        self._count('requests')
+        return self.client.run_report(request=request, retry=retry)
+
+    @staticmethod
+    def _is_lossy(response) -> bool:
+        metadata = response.metadata
+        return bool(metadata.data_loss_from_other_row or metadata.sampling_metadatas)
+
+    def _fetch_shard(self, query: Dict, shard: Dict, pages: queue.Queue,
+                     stop: threading.Event) -> List[Dict]:
+        """
+        Stream one shard into `pages`, one page of rows at a time.
+
+        Returns follow-up shards for the coordinator:
+        - a sampled or "(other)" first page is discarded and the shard's
+          date range halved, provided `date` is in the query so the halves'
+          rows stay distinct; otherwise the shard is reported as lossy
+        - a first page reporting more than max_shard_rows rows is kept, and
+          the remaining rows are returned as offset ranges fetched in parallel
+        """
+        offset = shard.get('offset', 0)
+        end_offset = shard.get('end_offset')
+        response = self._run_report(self._build_request(
+            query, shard, offset, limit=min(self.page_size, end_offset - offset) if end_offset else None))
+
+        follow_up = []
+        if end_offset is None:
+            if self._is_lossy(response):
+                # Without a date column, rows from two date halves can't be told apart or added up
+                children = split_shard(shard) if 'date' in query['dimensions'] else []
+                if children:
+                    self._count('splits')
+                    return children
+                self._count('sampled_shards')
+                reason = 'is a single day' if 'date' in query['dimensions'] else 'has no date dimension'
+                print(f"  ⚠️  Shard {shard['start_date']} is sampled or has an (other) row "
+                      f"and cannot be split by date (it {reason})")
+            end_offset = response.row_count
+            if response.row_count > self.max_shard_rows:
+                self._count('splits')
+                first_page = min(self.page_size, response.row_count)
+                follow_up = [
+                    dict(shard, offset=start, end_offset=min(start + self.max_shard_rows, response.row_count))
+                    for start in range(first_page, response.row_count, self.max_shard_rows)
+                ]
+                end_offset = first_page
+
+        self._count('shards')
+        while True:
+            rows = [
+                [value.value for value in row.dimension_values] +
+                [value.value for value in row.metric_values]
+                for row in response.rows
+            ]
+            offset += len(rows)
+            self._count('rows', len(rows))
+
+            # Blocks while the writer is behind, which keeps memory bounded
+            while not stop.is_set():
+                try:
+                    pages.put(rows, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+            if stop.is_set() or not rows or offset >= end_offset:
+                return follow_up
+            response = self._run_report(self._build_request(
+                query, shard, offset, limit=min(self.page_size, end_offset - offset)))
+
+    def _coordinate(self, query: Dict, shards: List[Dict], pages: queue.Queue,
+                    stop: threading.Event):
+        """Keep up to max_workers shards in flight and re-queue split shards"""
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                in_flight = set()
+                pending = list(shards)
+                while (pending or in_flight) and not stop.is_set():
+                    while pending and len(in_flight) < self.max_workers:
+                        in_flight.add(executor.submit(
+                            self._fetch_shard, query, pending.pop(0), pages, stop))
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.extend(future.result())
+        except Exception as e:
+            stop.set()
+            pages.put(e)
+            return
+        pages.put(_DONE)
+
+    def iter_rows(self, query: Dict, shard_days: Optional[int] = None,
+                  shard_filter: Optional[Dict] = None) -> Iterator[List[str]]:
+        """
+        Yield the rows of a (possibly sharded) report as they arrive.
+
+        Column order follows report_headers(shard_query(query, ...)).
+        """
+        shards = plan_shards(query, shard_days=shard_days, shard_filter=shard_filter)
+        query = shard_query(query, shard_days=shard_days, shard_filter=shard_filter)
+
+        pages = queue.Queue(maxsize=MAX_BUFFERED_PAGES)
+        stop = threading.Event()
+        coordinator = threading.Thread(
+            target=self._coordinate, args=(query, shards, pages, stop), daemon=True)
+        coordinator.start()
+
+        try:
+            while True:
+                page = pages.get()
+                if page is _DONE:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                yield from page
+        finally:
+            stop.set()
+
+    def run(self, query: Dict, output_path: str, shard_days: Optional[int] = None,
+            shard_filter: Optional[Dict] = None) -> Dict:
+        """Run a report and stream the merged result into output_path"""
+        headers = report_headers(shard_query(query, shard_days=shard_days,
+                                             shard_filter=shard_filter))
+        rows = self.iter_rows(query, shard_days=shard_days, shard_filter=shard_filter)
+        write_rows(output_path, headers, rows)
+        return self.stats
+
+
+def write_rows(output_path: str, headers: List[str], rows) -> int:
+    """Stream rows to a CSV file, or JSONL when the path ends in .jsonl"""
+    written = 0
+    with open(output_path, 'w', newline='') as f:
+        if output_path.endswith('.jsonl'):
+            for row in rows:
+                f.write(json.dumps(dict(zip(headers, row))) + '\n')
+                written += 1
+        else:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            for row in rows:
+                writer.writerow(row)
+                written += 1
+    return written
+
+
+def parse_shard_filter(value: Optional[str]) -> Optional[Dict]:
+    """Parse --shard-by DIMENSION=a,b;c into one in-list shard per ';' group"""
+    if not value:
+        return None
+    dimension, _, groups = value.partition('=')
+    if not groups:
+        raise ValueError("--shard-by expects DIMENSION=value[,value][;value...]")
+    return {
+        'dimension': dimension,
+        'values': [group.split(',') for group in groups.split(';')],
+    }
+
+
+def load_credentials(args):
+    """Resolve credentials from --auth / --service-account / environment"""
+    if args.auth:
+        print("🔐 Authenticating with OAuth2...")
+        return authenticate_oauth(DATA_SCOPES, get_token_path('token-readonly.json'))
+    if args.service_account:
+        from google.oauth2 import service_account
+
+        print(f"🔐 Using service account: {args.service_account}")
+        return service_account.Credentials.from_service_account_file(
+            args.service_account,
+            scopes=DATA_SCOPES
+        )
+    if os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+        print("🔐 Using service account from GOOGLE_APPLICATION_CREDENTIALS")
+    return None
+
+
+def add_auth_arguments(parser: argparse.ArgumentParser):
+    """Add the property and authentication flags shared by the report commands"""
+    parser.add_argument('--property-id', help='GA4 Property ID (can also use GA4_PROPERTY_ID env var)')
+    parser.add_argument('--auth', action='store_true', help='Use OAuth2 authentication')
+    parser.add_argument('--service-account', help='Path to service account JSON file')
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser):
+    """Add the report cache flags"""
+    parser.add_argument('--cache-dir', help='Report cache directory (default: GA4_REPORT_CACHE or ./ga4-cache)')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help='Evict least recently used responses beyond this size')
+    parser.add_argument('--no-cache', action='store_true', help='Always query the Data API')
+
+
+def load_cache(args) -> Optional[ReportCache]:
+    if args.no_cache:
+        return None
+    return ReportCache(get_cache_path(args.cache_dir), args.cache_max_mb * 1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run sharded GA4 Data API reports')
+    add_auth_arguments(parser)
+    parser.add_argument('--dimensions', required=True, help='Comma-separated dimension names')
+    parser.add_argument('--metrics', required=True, help='Comma-separated metric names')
+    parser.add_argument('--start-date', default='28daysAgo', help='YYYY-MM-DD, NdaysAgo, yesterday or today')
+    parser.add_argument('--end-date', default='yesterday', help='YYYY-MM-DD, NdaysAgo, yesterday or today')
+    parser.add_argument('--output', required=True, help='Result file (.csv or .jsonl)')
+    parser.add_argument('--shard-days', type=int, help='Days per date shard (default: auto)')
+    parser.add_argument('--shard-by', help='Dimension filter shards, e.g. customEvent:budget=ready-high;ready-low')
+    parser.add_argument('--max-workers', type=int, default=MAX_CONCURRENT_REQUESTS,
+                        help='Concurrent Data API requests')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='Rows per page')
+    add_cache_arguments(parser)
+    add_cassette_arguments(parser)
+
+    args = parser.parse_args()
+
+    property_id = args.property_id or os.getenv('GA4_PROPERTY_ID')
+    if not property_id:
+        print("❌ Property ID required! Use --property-id or set GA4_PROPERTY_ID environment variable")
+        sys.exit(1)
+
+    query = {
+        'dimensions': args.dimensions.split(','),
+        'metrics': args.metrics.split(','),
+        'start_date': args.start_date,
+        'end_date': args.end_date,
+    }
+
+    # Recording and replaying should see every request, so they bypass the cache
+    cassette = args.record or args.replay
+    runner = ReportRunner(property_id, None if args.replay else load_credentials(args),
+                          client=ReplayClient(args.replay, args.replay_speed) if args.replay else None,
+                          max_workers=args.max_workers, page_size=args.page_size,
+                          cache=None if cassette else load_cache(args))
+    if args.record:
+        runner.client = RecordingClient(runner.client, CassetteWriter(args.record))
+
+    print(f"\n📊 Running report for property: {property_id}")
+    try:
+        stats = runner.run(query, args.output, shard_days=args.shard_days,
+                           shard_filter=parse_shard_filter(args.shard_by))
+    except Exception as e:
+        print(f"\n❌ Report failed: {e}")
+        sys.exit(1)
+
+    print(f"✅ Wrote {stats['rows']} rows to {args.output}")
+    print(f"   {stats['shards']} shards, {stats['splits']} splits, {stats['requests']} requests, "
+          f"{stats['cache_hits']} served from cache")
+
+
+if __name__ == '__main__':
+    main()
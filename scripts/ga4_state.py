@@ -0,0 +1,107 @@
+"""
+GA4 Fleet State Module - fingerprints of applied configuration per property
+
+After a property has been brought in line with a desired state, the fleet
+tool records:
+
+- a fingerprint (SHA-256) of the desired state it was applied from
+- the property's account, needed for change-history queries
+- when the apply finished
+- a change-history cursor: the newest change GA4 had recorded by then
+
+On the next run, a property whose fingerprint still matches is checked
+with a single search_change_history_events call for changes after the
+cursor. If nobody has touched it since, it is skipped without reading its
+configuration or writing anything.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_STATE_FILE = 'ga4-fleet-state.json'
+
+
+def get_state_path(path: Optional[str] = None) -> Path:
+    """State file location from --state, GA4_FLEET_STATE or ./ga4-fleet-state.json"""
+    return Path(path or os.getenv('GA4_FLEET_STATE') or DEFAULT_STATE_FILE)
+
+
+def fingerprint(desired: Dict) -> str:
+    """Stable hash of a desired state; key order and whitespace don't matter"""
+    canonical = json.dumps(desired, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class FleetState:
+    """Per-property apply records, loaded from and saved to a JSON file"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if path.exists():
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, property_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self.entries.get(property_id)
+
+    def record(self, property_id: str, fingerprint: str, account: str, cursor: datetime):
+        with self._lock:
+            self.entries[property_id] = {
+                'fingerprint': fingerprint,
+                'account': account,
+                'applied_at': datetime.now(timezone.utc).isoformat(),
+                'cursor': cursor.isoformat(),
+            }
+
+    def forget(self, property_id: str):
+        with self._lock:
+            self.entries.pop(property_id, None)
+
+    def save(self):
+        """Write atomically, so an interrupted run never leaves a truncated file"""
+        with self._lock:
+            tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            tmp_path.replace(self.path)
+
+
+def latest_change_time(automation, account: str, since: Optional[datetime] = None) -> Optional[datetime]:
+    """Time of the newest change-history event on the property after `since`, if any"""
+    request = {
+        'account': account,
+        'property': automation.property_path,
+        'page_size': 1,
+    }
+    if since:
+        request['earliest_change_time'] = since
+    # Events come back newest first, so the first page's first event is the latest
+    events = automation.call('search_change_history_events', request=request).change_history_events
+    return events[0].change_time if events else None
+
+
+def is_unchanged(automation, entry: Optional[Dict], desired_fingerprint: str) -> bool:
+    """True if `entry` was applied from this desired state and GA4 shows no changes since"""
+    if not entry or entry['fingerprint'] != desired_fingerprint:
+        return False
+    cursor = datetime.fromisoformat(entry['cursor'])
+    latest = latest_change_time(automation, entry['account'], cursor)
+    return latest is None or latest <= cursor
+
+
+def current_cursor(automation, account: str, started: datetime) -> datetime:
+    """
+    Cursor to store after an apply: the newest change recorded so far.
+
+    The apply's own writes are in change history too, so the cursor has to
+    move past them or the next run would see them as external changes.
+    """
+    latest = latest_change_time(automation, account, started)
+    return max(latest, started) if latest else started
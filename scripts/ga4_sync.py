@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+GA4 Report Sync - incremental, date-partitioned local report store
+
+Stores report results as one directory per day with one NumPy column file
+per dimension/metric:
+
+   <store>/<report>/_report.json
+   <store>/<report>/date=20250101/_partition.json
+   <store>/<report>/date=20250101/customEvent:scene.npy
+   <store>/<report>/date=20250101/eventCount.npy
+
+Each run only fetches days that have no partition yet, plus the most
+recent --refresh-days days to pick up late-arriving data. Partitions are
+read back as memory-mapped arrays, so analyses page in only the columns
+and days they touch instead of copying the whole dataset into RAM.
+
+Usage:
+   python ga4_sync.py --property-id=123456789 --name=scenes \\
+       --dimensions=customEvent:scene,customEvent:choice --metrics=eventCount \\
+       --since=365daysAgo [--refresh-days=3] [--store=ga4-data]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ga4_reports import ReportRunner, add_auth_arguments, load_credentials, resolve_date
+
+# Days re-fetched on every run; GA4 keeps processing events for ~48 hours
+DEFAULT_REFRESH_DAYS = 3
+
+# Days fetched per report run; bounds the rows held in memory before writing
+SYNC_CHUNK_DAYS = 30
+
+DEFAULT_STORE = 'ga4-data'
+
+PARTITION_PREFIX = 'date='
+
+
+def get_store_path(store: Optional[str] = None) -> Path:
+    """Local store location from --store, GA4_REPORT_STORE or ./ga4-data"""
+    return Path(store or os.getenv('GA4_REPORT_STORE') or DEFAULT_STORE)
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day.strftime('%Y%m%d')}"
+
+
+def existing_partitions(report_path: Path) -> List[date]:
+    """Days that already have a complete partition, oldest first"""
+    if not report_path.exists():
+        return []
+    days = []
+    for entry in report_path.iterdir():
+        if entry.name.startswith(PARTITION_PREFIX) and (entry / '_partition.json').exists():
+            days.append(datetime.strptime(entry.name[len(PARTITION_PREFIX):], '%Y%m%d').date())
+    return sorted(days)
+
+
+def days_to_fetch(start: date, end: date, existing: List[date],
+                  refresh_days: int = DEFAULT_REFRESH_DAYS) -> List[date]:
+    """Days in [start, end] without a partition, plus the last refresh_days days"""
+    have = set(existing)
+    refresh_from = end - timedelta(days=refresh_days - 1)
+    days = []
+    day = start
+    while day <= end:
+        if day not in have or day >= refresh_from:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def group_ranges(days: List[date], max_days: int = SYNC_CHUNK_DAYS) -> List[Tuple[date, date]]:
+    """Group sorted days into contiguous (start, end) ranges of at most max_days"""
+    ranges = []
+    for day in days:
+        if ranges:
+            range_start, range_end = ranges[-1]
+            if day == range_end + timedelta(days=1) and (day - range_start).days < max_days:
+                ranges[-1] = (range_start, day)
+                continue
+        ranges.append((day, day))
+    return ranges
+
+
+def to_column(values: List[str], is_metric: bool) -> np.ndarray:
+    """Convert report strings to a fixed-width (memory-mappable) column"""
+    column = np.array(values, dtype=str)
+    if not is_metric:
+        return column
+    try:
+        return column.astype(np.int64)
+    except ValueError:
+        return column.astype(np.float64)
+
+
+def write_partition(report_path: Path, day: date, headers: List[str],
+                    metrics: List[str], rows: List[List[str]]):
+    """Atomically write (or replace) one day's partition"""
+    final_path = report_path / partition_name(day)
+    tmp_path = report_path / f".{final_path.name}.tmp"
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    columns = list(zip(*rows)) if rows else [()] * len(headers)
+    for header, values in zip(headers, columns):
+        np.save(tmp_path / f"{header}.npy", to_column(list(values), header in metrics))
+
+    with open(tmp_path / '_partition.json', 'w') as f:
+        json.dump({
+            'date': day.isoformat(),
+            'rows': len(rows),
+            'columns': headers,
+            'synced_at': datetime.now(timezone.utc).isoformat(),
+        }, f)
+
+    # Swap the new partition in; readers never see a half-written directory
+    old_path = report_path / f".{final_path.name}.old"
+    if final_path.exists():
+        final_path.rename(old_path)
+    tmp_path.rename(final_path)
+    if old_path.exists():
+        shutil.rmtree(old_path)
+
+
+def load_report_definition(report_path: Path, query: Dict, property_id: str) -> Dict:
+    """Check (or record) the property and dimensions/metrics a report store was created with"""
+    definition_path = report_path / '_report.json'
+    definition = {'property_id': str(property_id), 'dimensions': query['dimensions'], 'metrics': query['metrics']}
+    if definition_path.exists():
+        with open(definition_path) as f:
+            stored = json.load(f)
+        if stored.get('property_id', definition['property_id']) != definition['property_id']:
+            raise ValueError(
+                f"{report_path.name} holds data for property {stored['property_id']}; "
+                "use a different --name for a different property"
+            )
+        if stored['dimensions'] != definition['dimensions'] or stored['metrics'] != definition['metrics']:
+            raise ValueError(
+                f"{report_path.name} was synced with {stored['dimensions']} / {stored['metrics']}; "
+                "use a different --name for a different query"
+            )
+        if 'property_id' not in stored:
+            # Stores from before the property was recorded adopt the first property synced into them
+            with open(definition_path, 'w') as f:
+                json.dump(definition, f, indent=2)
+    else:
+        report_path.mkdir(parents=True, exist_ok=True)
+        with open(definition_path, 'w') as f:
+            json.dump(definition, f, indent=2)
+    return definition
+
+
+def sync_report(runner: ReportRunner, store_path: Path, name: str,
+                dimensions: List[str], metrics: List[str], since: str,
+                until: str = 'yesterday',
+                refresh_days: int = DEFAULT_REFRESH_DAYS) -> Dict:
+    """Fetch missing and recent days for a report into the local store"""
+    report_path = store_path / name
+    dimensions = ['date'] + [d for d in dimensions if d != 'date']
+    query = {'dimensions': dimensions, 'metrics': metrics}
+    load_report_definition(report_path, query, runner.property_id)
+
+    start, end = resolve_date(since), resolve_date(until)
+    days = days_to_fetch(start, end, existing_partitions(report_path), refresh_days)
+    headers = dimensions + metrics
+
+    stats = {'days': len(days), 'rows': 0, 'requests': 0}
+    for range_start, range_end in group_ranges(days):
+        print(f"  📥 Fetching {range_start} → {range_end}")
+        chunk_query = dict(query, start_date=range_start.isoformat(), end_date=range_end.isoformat())
+
+        by_day = {}
+        for row in runner.iter_rows(chunk_query, shard_days=1):
+            by_day.setdefault(row[0], []).append(row)
+
+        # Days with no rows still get an (empty) partition so they aren't re-fetched
+        day = range_start
+        while day <= range_end:
+            rows = by_day.get(day.strftime('%Y%m%d'), [])
+            write_partition(report_path, day, headers, metrics, rows)
+            stats['rows'] += len(rows)
+            day += timedelta(days=1)
+
+    stats['requests'] = runner.stats['requests']
+    return stats
+
+
+def iter_partitions(store_path: Path, name: str, columns: Optional[List[str]] = None,
+                    start: Optional[date] = None,
+                    end: Optional[date] = None) -> Iterator[Tuple[date, Dict[str, np.ndarray]]]:
+    """Yield (day, {column: memory-mapped array}) for each stored partition"""
+    report_path = store_path / name
+    for day in existing_partitions(report_path):
+        if (start and day < start) or (end and day > end):
+            continue
+        partition_path = report_path / partition_name(day)
+        if columns is None:
+            with open(partition_path / '_partition.json') as f:
+                names = json.load(f)['columns']
+        else:
+            names = columns
+        yield day, {
+            column: np.load(partition_path / f"{column}.npy", mmap_mode='r')
+            for column in names
+        }
+
+
+def load_columns(store_path: Path, name: str, columns: List[str],
+                 start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, np.ndarray]:
+    """Concatenate the requested columns across partitions (copies only those columns)"""
+    parts = {column: [] for column in columns}
+    for _, arrays in iter_partitions(store_path, name, columns, start, end):
+        for column in columns:
+            parts[column].append(arrays[column])
+    return {
+        column: np.concatenate(arrays) if arrays else np.array([])
+        for column, arrays in parts.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incrementally sync GA4 reports into a local store')
+    add_auth_arguments(parser)
+    parser.add_argument('--name', required=True, help='Report name (directory in the store)')
+    parser.add_argument('--dimensions', required=True, help='Comma-separated dimension names')
+    parser.add_argument('--metrics', required=True, help='Comma-separated metric names')
+    parser.add_argument('--since', default='365daysAgo', help='First day to keep in the store')
+    parser.add_argument('--until', default='yesterday', help='Last day to sync')
+    parser.add_argument('--refresh-days', type=int, default=DEFAULT_REFRESH_DAYS,
+                        help='Recent days to re-fetch for late data')
+    parser.add_argument('--store', help='Store directory (can also use GA4_REPORT_STORE env var)')
+
+    args = parser.parse_args()
+
+    property_id = args.property_id or os.getenv('GA4_PROPERTY_ID')
+    if not property_id:
+        print("❌ Property ID required! Use --property-id or set GA4_PROPERTY_ID environment variable")
+        sys.exit(1)
+
+    store_path = get_store_path(args.store)
+    runner = ReportRunner(property_id, load_credentials(args))
+
+    print(f"\n🔄 Syncing {args.name} for property {property_id} into {store_path}")
+    try:
+        stats = sync_report(
+            runner, store_path, args.name,
+            dimensions=args.dimensions.split(','),
+            metrics=args.metrics.split(','),
+            since=args.since,
+            until=args.until,
+            refresh_days=args.refresh_days,
+        )
+    except Exception as e:
+        print(f"\n❌ Sync failed: {e}")
+        sys.exit(1)
+
+    print(f"✅ Synced {stats['days']} days ({stats['rows']} rows, {stats['requests']} requests)")
+
+
+if __name__ == '__main__':
+    main()
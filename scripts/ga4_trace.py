@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+GA4 Trace Module - OpenTelemetry-style spans for provisioning runs
+
+Spans are written as JSON lines to a local file, with no collector or SDK
+needed. Each span has:
+
+- trace_id, span_id and parent_span_id
+- name, and start/end times in unix nanoseconds
+- attributes, and status 'OK' or 'ERROR'
+
+Tracing is off unless a file is configured, with --trace on ga4_fleet.py
+or with the GA4_TRACE_FILE environment variable (which also covers
+setup-ga4-secure.py). When off, span() costs one attribute check.
+
+The summary command reads a trace file and prints, for each run, its
+critical path and the operations that took the most time per property.
+
+Usage:
+   GA4_TRACE_FILE=trace.jsonl python setup-ga4-secure.py --auth
+   python ga4_fleet.py --trace=trace.jsonl apply --properties-file=sites.txt
+   python ga4_trace.py summary trace.jsonl [--top=5]
+"""
+
+import argparse
+import atexit
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Span of the code currently running, per thread / asyncio task
+_current_span = contextvars.ContextVar('ga4_current_span', default=None)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_span_id', 'name', 'start', 'end', 'attributes', 'status')
+
+    def __init__(self, name: str, parent: Optional['Span'], attributes: Dict):
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.name = name
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+        self.status = 'OK'
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_span_id,
+            'name': self.name,
+            'start_time_unix_nano': self.start,
+            'end_time_unix_nano': self.end,
+            'attributes': self.attributes,
+            'status': self.status,
+        }
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Writes finished spans to a JSONL file; disabled when path is None"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+        if path:
+            self._file = open(path, 'a')
+            atexit.register(self.close)
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        if self._file is None:
+            yield _NOOP_SPAN
+            return
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if not (isinstance(e, SystemExit) and not e.code):
+                span.status = 'ERROR'
+                span.attributes['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end = time.time_ns()
+            self._write(span)
+
+    def record(self, name: str, start: int, end: int, **attributes):
+        """Add an already finished span (e.g. time spent sleeping) under the current one"""
+        if self._file is None:
+            return
+        span = Span(name, _current_span.get(), attributes)
+        span.start, span.end = start, end
+        self._write(span)
+
+    def _write(self, span: Span):
+        line = json.dumps(span.to_dict()) + '\n'
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_tracer = Tracer(os.getenv('GA4_TRACE_FILE'))
+
+
+def configure(path: Optional[str]) -> Tracer:
+    """Send spans to `path` (appending), replacing any earlier configuration"""
+    global _tracer
+    _tracer.close()
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def span(name: str, **attributes):
+    """Context manager for a span under the current one (no-op when tracing is off)"""
+    return _tracer.span(name, **attributes)
+
+
+def record_span(name: str, start: int, end: int, **attributes):
+    """Add a finished span under the current one (no-op when tracing is off)"""
+    _tracer.record(name, start, end, **attributes)
+
+
+def load_spans(path: str) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def duration_ms(s: Dict) -> float:
+    return (s['end_time_unix_nano'] - s['start_time_unix_nano']) / 1e6
+
+
+def self_time_ms(s: Dict, children: List[Dict]) -> float:
+    """Time in a span not covered by any child (overlapping children count once)"""
+    covered = 0
+    cursor = s['start_time_unix_nano']
+    for child in sorted(children, key=lambda c: c['start_time_unix_nano']):
+        start = max(child['start_time_unix_nano'], cursor)
+        end = min(child['end_time_unix_nano'], s['end_time_unix_nano'])
+        if end > start:
+            covered += end - start
+            cursor = end
+    return (s['end_time_unix_nano'] - s['start_time_unix_nano'] - covered) / 1e6
+
+
+def critical_path(s: Dict, children: Dict[str, List[Dict]]) -> List[Tuple[int, Dict]]:
+    """
+    The chain of spans that determined when `s` finished, as (depth, span).
+
+    Walks back from the span's end: the child that ended last is on the
+    path, then the latest child that ended before that one started, and so
+    on, recursing into each.
+    """
+    path = [(0, s)]
+    boundary = s['end_time_unix_nano']
+    chain = []
+    for child in sorted(children.get(s['span_id'], []), key=lambda c: c['end_time_unix_nano'], reverse=True):
+        if child['end_time_unix_nano'] <= boundary:
+            chain.append(child)
+            boundary = child['start_time_unix_nano']
+    for child in reversed(chain):
+        path.extend((depth + 1, span) for depth, span in critical_path(child, children))
+    return path
+
+
+def summarize(spans: List[Dict], top: int = 5) -> str:
+    """Critical path per root span and top operations (by self time) per property"""
+    by_id = {s['span_id']: s for s in spans}
+    children = defaultdict(list)
+    roots = []
+    for s in spans:
+        if s['parent_span_id'] in by_id:
+            children[s['parent_span_id']].append(s)
+        else:
+            roots.append(s)
+
+    def target_of(s: Dict) -> Optional[str]:
+        while s is not None:
+            target = s['attributes'].get('target')
+            if target:
+                return target
+            s = by_id.get(s['parent_span_id'])
+        return None
+
+    lines = []
+    for root in sorted(roots, key=lambda s: s['start_time_unix_nano']):
+        lines.append(f"\n🧭 {root['name']} {duration_ms(root):.0f}ms — critical path:")
+        for depth, s in critical_path(root, children):
+            label = s['attributes'].get('target') or ''
+            status = ' ❌' if s['status'] != 'OK' else ''
+            lines.append(f"   {'  ' * depth}{s['name']} {label} {duration_ms(s):.0f}ms{status}".rstrip())
+
+    per_target = defaultdict(lambda: defaultdict(lambda: [0, 0.0]))
+    for s in spans:
+        target = target_of(s)
+        if target is None:
+            continue
+        entry = per_target[target][s['name']]
+        entry[0] += 1
+        entry[1] += self_time_ms(s, children.get(s['span_id'], []))
+
+    if per_target:
+        lines.append(f"\n📊 Top {top} operations per property (self time):")
+        slowest = sorted(
+            per_target.items(),
+            key=lambda item: -sum(total for _, total in item[1].values()),
+        )
+        for target, names in slowest:
+            total = sum(ms for _, ms in names.values())
+            lines.append(f"   {target} ({total:.0f}ms)")
+            for name, (count, ms) in sorted(names.items(), key=lambda item: -item[1][1])[:top]:
+                lines.append(f"      {name:<40} {ms:>8.0f}ms  ×{count}")
+
+    totals = defaultdict(lambda: [0, 0.0])
+    for s in spans:
+        entry = totals[s['name']]
+        entry[0] += 1
+        entry[1] += self_time_ms(s, children.get(s['span_id'], []))
+    lines.append("\n⏱️  All operations (self time):")
+    for name, (count, ms) in sorted(totals.items(), key=lambda item: -item[1][1])[:top * 3]:
+        lines.append(f"   {name:<43} {ms:>8.0f}ms  ×{count}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize GA4 provisioning trace files')
+    commands = parser.add_subparsers(dest='command', required=True)
+    summary_parser = commands.add_parser('summary', help='Critical path and top time consumers')
+    summary_parser.add_argument('trace_file', help='JSONL trace written with --trace / GA4_TRACE_FILE')
+    summary_parser.add_argument('--top', type=int, default=5, help='Operations listed per property')
+
+    args = parser.parse_args()
+    spans = load_spans(args.trace_file)
+    print(f"🔍 {len(spans)} spans from {args.trace_file}")
+    print(summarize(spans, args.top))
+
+
+if __name__ == '__main__':
+    main()
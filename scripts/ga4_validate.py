@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+GA4 Event Validator - check payloads against ga4-config.json and screen for PII
+
+The event definitions are compiled once into frozensets keyed by event
+name, and every PII pattern is folded into a single regular expression.
+Checking a clean event then costs:
+
+- one dict lookup for the event name
+- one subset test for undeclared parameters
+- one regex search over all of the event's string values, joined together
+
+Only events that fail a check pay for locating the offending parameter.
+
+Streams JSONL files of Measurement Protocol payloads ({client_id, events,
+user_properties}) or bare events ({name, params}), and either reports the
+violations or writes a stripped copy.
+
+Usage:
+   python ga4_validate.py events.jsonl                 # report only
+   python ga4_validate.py events.jsonl --strip -o clean.jsonl
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Match, Optional, TextIO, Tuple
+
+from ga4_mp import DEFAULT_CONFIG_PATH, PII_PARAM_NAMES, load_tracking_config
+
+# Parameters GA4 accepts on any event in addition to the declared ones
+RESERVED_PARAMS = frozenset({
+    'event_id', 'engagement_time_msec', 'session_id', 'debug_mode',
+    'page_location', 'page_referrer', 'page_title',
+})
+
+# GA4 collection limits
+MAX_PARAMS_PER_EVENT = 25
+MAX_NAME_LENGTH = 40
+MAX_VALUE_LENGTH = 100
+
+# Generated identifiers; opaque and high-entropy, so never scanned for PII
+UNSCANNED_PARAMS = frozenset({'event_id', 'session_id'})
+
+# One alternation, so each event is scanned with a single regex call. Every
+# branch checks its left boundary with a lookbehind right after its first
+# character, so the engine gives up on a position after one or two steps
+# unless a match can really start there. Card matches are confirmed with
+# the Luhn checksum in find_pii(), so long digit IDs are not flagged.
+PII_PATTERN = re.compile(
+    r'(?P<email>[\w.%+-](?<![\w.%+-][\w.%+-])[\w.%+-]*@[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{2,})'
+    r'|(?P<card>\d(?<!\d\d)(?:[ -]?\d){12,18}\b)'
+    r'|(?P<ssn>\d(?<!\d\d)\d{2}-\d{2}-\d{4}\b)'
+    # Bare digit runs (timestamps, order IDs) are not phones: a '+' or separators are required
+    r'|(?P<phone>[+(\d](?<![\d+(][+(\d])'
+    r'(?:(?<=\+)\d{10,15}|\d{0,3}\)?[\s.-]?\d{3}[\s.-]\d{4})\b)'
+)
+
+# Violations that drop the whole event rather than one parameter
+EVENT_VIOLATIONS = frozenset({'unknown_event', 'too_many_params', 'malformed'})
+
+# Joins values for the combined scan; not a word character, so \b still works
+_VALUE_SEPARATOR = '\x1f'
+
+# (code, parameter or None, detail)
+Violation = Tuple[str, Optional[str], str]
+
+
+def luhn_valid(number: str) -> bool:
+    """Luhn checksum of the digits in `number` (separators are ignored)"""
+    total = 0
+    for i, digit in enumerate(int(c) for c in reversed(number) if c.isdigit()):
+        if i % 2:
+            digit = digit * 2 - 9 if digit > 4 else digit * 2
+        total += digit
+    return total % 10 == 0
+
+
+def find_pii(text: str) -> Optional[Match]:
+    """First PII match in `text`; card-like digit runs only count if they pass Luhn"""
+    for match in PII_PATTERN.finditer(text):
+        if match.lastgroup != 'card' or luhn_valid(match.group()):
+            return match
+    return None
+
+
+class EventValidator:
+    def __init__(self, definitions: Dict[str, Iterable[str]], user_properties: Iterable[str] = ()):
+        self.allowed_params = {
+            name: frozenset(params) | RESERVED_PARAMS
+            for name, params in definitions.items()
+        }
+        self.user_properties = frozenset(user_properties)
+
+    @classmethod
+    def from_config(cls, config_path: Path = DEFAULT_CONFIG_PATH) -> 'EventValidator':
+        """Compile customEvents and user-scoped customDimensions from ga4-config.json"""
+        config = load_tracking_config(config_path)
+        return cls(
+            {event['name']: event['parameters'] for event in config['customEvents']},
+            [dim['name'] for dim in config['customDimensions'] if dim['scope'] == 'user'],
+        )
+
+    @staticmethod
+    def scan_values(values: Dict) -> List[Violation]:
+        """PII violations in a params/user_properties dict"""
+        violations = [
+            ('pii', key, 'name') for key in PII_PARAM_NAMES.intersection(values)
+        ]
+        strings = [
+            value for key, value in values.items()
+            if value.__class__ is str and key not in UNSCANNED_PARAMS
+        ]
+        if strings and find_pii(_VALUE_SEPARATOR.join(strings)):
+            for key, value in values.items():
+                if key in PII_PARAM_NAMES or key in UNSCANNED_PARAMS or value.__class__ is not str:
+                    continue
+                match = find_pii(value)
+                if match:
+                    violations.append(('pii', key, match.lastgroup))
+        return violations
+
+    def check_event(self, event: Dict) -> List[Violation]:
+        """All violations for one {name, params} event; empty if it is clean"""
+        if not isinstance(event, dict):
+            return [('malformed', None, f"event is a {type(event).__name__}, not an object")]
+        name = event.get('name')
+        allowed = self.allowed_params.get(name) if isinstance(name, str) else None
+        if allowed is None:
+            return [('unknown_event', None, str(name))]
+
+        params = event.get('params') or {}
+        if not isinstance(params, dict):
+            return [('malformed', 'params', f"params is a {type(params).__name__}, not an object")]
+        strings = [
+            value for key, value in params.items()
+            if value.__class__ is str and key not in UNSCANNED_PARAMS
+        ]
+
+        # Fast path: a handful of C-level checks clear almost every event
+        if (
+            params.keys() <= allowed
+            and len(params) <= MAX_PARAMS_PER_EVENT
+            and max(map(len, strings), default=0) <= MAX_VALUE_LENGTH
+            and max(map(len, params), default=0) <= MAX_NAME_LENGTH
+            and PII_PARAM_NAMES.isdisjoint(params)
+            and not (strings and find_pii(_VALUE_SEPARATOR.join(strings)))
+        ):
+            return []
+
+        violations = [
+            ('undeclared_param', key, name) for key in params.keys() - allowed
+        ]
+        if len(params) > MAX_PARAMS_PER_EVENT:
+            violations.append(('too_many_params', None, str(len(params))))
+        for key, value in params.items():
+            if len(key) > MAX_NAME_LENGTH:
+                violations.append(('name_too_long', key, name))
+            if isinstance(value, str) and len(value) > MAX_VALUE_LENGTH:
+                violations.append(('value_too_long', key, str(len(value))))
+        violations.extend(self.scan_values(params))
+        return violations
+
+    def check_user_properties(self, properties: Dict) -> List[Violation]:
+        """Violations in an MP user_properties dict ({name: {'value': ...}})"""
+        if not isinstance(properties, dict):
+            return [('malformed', 'user_properties', f"user_properties is a {type(properties).__name__}, not an object")]
+        violations = [
+            ('unknown_user_property', key, key) for key in properties.keys() - self.user_properties
+        ]
+        values = {
+            key: prop.get('value') if isinstance(prop, dict) else prop
+            for key, prop in properties.items()
+        }
+        violations.extend(self.scan_values(values))
+        return violations
+
+    @staticmethod
+    def strip(values: Dict, violations: List[Violation]) -> Dict:
+        """Copy of params/user_properties without the parameters that violated"""
+        bad = {key for _, key, _ in violations if key is not None}
+        return {key: value for key, value in values.items() if key not in bad}
+
+    def clean_payload(self, payload: Dict) -> Tuple[Optional[Dict], List[Violation]]:
+        """
+        Validate an MP payload or a bare event and return a cleaned copy.
+
+        Unknown events and events over the parameter limit are dropped;
+        offending parameters and user properties are removed. Returns None
+        when nothing is left to send.
+        """
+        shape = payload_shape_violations(payload)
+        if shape:
+            return None, shape
+        if 'events' not in payload:
+            event, violations = self.clean_event(payload)
+            return event, violations
+
+        violations = []
+        events = []
+        for event in payload['events']:
+            cleaned, event_violations = self.clean_event(event)
+            violations.extend(event_violations)
+            if cleaned is not None:
+                events.append(cleaned)
+        if not events:
+            return None, violations
+
+        cleaned = dict(payload, events=events)
+        if 'user_properties' in payload:
+            property_violations = self.check_user_properties(payload['user_properties'])
+            if any(code == 'malformed' for code, _, _ in property_violations):
+                violations.extend(property_violations)
+                del cleaned['user_properties']
+            elif property_violations:
+                violations.extend(property_violations)
+                cleaned['user_properties'] = self.strip(payload['user_properties'], property_violations)
+        return cleaned, violations
+
+    def clean_event(self, event: Dict) -> Tuple[Optional[Dict], List[Violation]]:
+        """Event with violating parameters removed, or None if the event itself is invalid"""
+        violations = self.check_event(event)
+        if not violations:
+            return event, violations
+        if any(code in EVENT_VIOLATIONS for code, _, _ in violations):
+            return None, violations
+        return dict(event, params=self.strip(event.get('params') or {}, violations)), violations
+
+    def check_payload(self, payload: Dict) -> List[Violation]:
+        """Violations in an MP payload or bare event, without cleaning"""
+        shape = payload_shape_violations(payload)
+        if shape:
+            return shape
+        if 'events' not in payload:
+            return self.check_event(payload)
+        violations = []
+        for event in payload['events']:
+            violations.extend(self.check_event(event))
+        if 'user_properties' in payload:
+            violations.extend(self.check_user_properties(payload['user_properties']))
+        return violations
+
+
+def payload_shape_violations(payload) -> List[Violation]:
+    """A 'malformed' violation if payload isn't an object, or its events aren't a list"""
+    if not isinstance(payload, dict):
+        return [('malformed', None, f"payload is a {type(payload).__name__}, not an object")]
+    if 'events' in payload and not isinstance(payload['events'], list):
+        return [('malformed', 'events', f"events is a {type(payload['events']).__name__}, not a list")]
+    return []
+
+
+def validate_stream(lines: Iterable[str], validator: EventValidator,
+                    output: Optional[TextIO] = None) -> Dict:
+    """
+    Validate JSONL payloads line by line.
+
+    When `output` is given, cleaned payloads are written to it (stripping
+    mode); otherwise lines are only checked. Returns counts per violation
+    code and per parameter.
+    """
+    stats = {'lines': 0, 'invalid_json': 0, 'clean': 0, 'dropped': 0}
+    by_code = Counter()
+    by_param = Counter()
+    dumps = json.dumps
+    loads = json.loads
+
+    for line in lines:
+        if not line.strip():
+            continue
+        stats['lines'] += 1
+        try:
+            payload = loads(line)
+        except ValueError:
+            stats['invalid_json'] += 1
+            continue
+
+        if output is None:
+            violations = validator.check_payload(payload)
+        else:
+            cleaned, violations = validator.clean_payload(payload)
+            if cleaned is None:
+                stats['dropped'] += 1
+            elif violations:
+                output.write(dumps(cleaned) + '\n')
+            else:
+                output.write(line if line.endswith('\n') else line + '\n')
+
+        if not violations:
+            stats['clean'] += 1
+            continue
+        for code, key, detail in violations:
+            by_code[code] += 1
+            by_param[f"{code}:{key or detail}"] += 1
+
+    stats['violations'] = dict(by_code)
+    stats['by_param'] = dict(by_param.most_common())
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate GA4 event payloads and screen them for PII')
+    parser.add_argument('input', help="JSONL file of MP payloads or events ('-' for stdin)")
+    parser.add_argument('--strip', action='store_true', help='Write cleaned payloads instead of only reporting')
+    parser.add_argument('-o', '--output', help='Output file for --strip (default: stdout)')
+    parser.add_argument('--config', default=str(DEFAULT_CONFIG_PATH), help='Path to ga4-config.json')
+
+    args = parser.parse_args()
+
+    validator = EventValidator.from_config(Path(args.config))
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output = None
+    if args.strip:
+        output = open(args.output, 'w') if args.output else sys.stdout
+
+    # Keep stdout clean for the stripped stream
+    log = sys.stderr if output is sys.stdout else sys.stdout
+
+    started = time.perf_counter()
+    try:
+        stats = validate_stream(source, validator, output)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output not in (None, sys.stdout):
+            output.close()
+    elapsed = time.perf_counter() - started
+
+    print(f"\n🔍 Checked {stats['lines']} payloads in {elapsed:.2f}s "
+          f"({stats['lines'] / elapsed if elapsed else 0:.0f}/sec)", file=log)
+    print(f"   ✅ {stats['clean']} clean", file=log)
+    if stats['invalid_json']:
+        print(f"   ❌ {stats['invalid_json']} invalid JSON lines", file=log)
+    if stats['dropped']:
+        print(f"   🗑️  {stats['dropped']} payloads dropped", file=log)
+    for code, count in sorted(stats['violations'].items()):
+        print(f"   ⚠️  {code}: {count}", file=log)
+    for key, count in list(stats['by_param'].items())[:20]:
+        print(f"      {key}: {count}", file=log)
+
+    sys.exit(0 if not stats['violations'] and not stats['invalid_json'] else 1)
+
+
+if __name__ == '__main__':
+    main()